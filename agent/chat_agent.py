@@ -5,23 +5,43 @@ ChatAgent RAG-ready para agir como Analista Financeiro Sênior.
 Atualizações nesta versão:
 - Corrige avisos do Pylance relacionados a tipos do cliente `openai.OpenAI`
   (cast de mensagens/resp para `Any` na hora da chamada).
-- Mantém persistência de embeddings (pickle), chunking e busca semântica.
+- Mantém persistência de embeddings (.npy + metadados JSON em colunas), chunking e busca semântica.
 """
 
 from __future__ import annotations
 import os
-import json
-import pickle
+import asyncio
+import base64
+import hashlib
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
-from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional, Tuple, cast
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional, Tuple, cast
 
 import numpy as np
 
+from utils import json_rapido
+
+# tiktoken é usado só para limitar os lotes de embedding por tokens
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None
+
+# Backends opcionais para a busca semântica (numpy é o padrão e não exige nada extra)
+try:
+    import faiss  # type: ignore
+except Exception:
+    faiss = None
+try:
+    import simsimd  # type: ignore
+except Exception:
+    simsimd = None
+
 # OpenAI client (versões 1.x+)
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI, OpenAI
     # Adicionando os tipos específicos para clareza e correção de tipagem
     from openai.types.create_embedding_response import CreateEmbeddingResponse
     from openai.types.chat import ChatCompletionMessageParam
@@ -36,214 +56,489 @@ try:
     EMBEDDING_MODEL = getattr(settings, "OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
     TEMPERATURE = float(getattr(settings, "OPENAI_TEMPERATURE", 0.3))
     SYSTEM_PROMPT_BASE = getattr(settings, "PROMPT_ANALISTA_SISTEMA", "Você é um analista financeiro sênior.")
+    EMBEDDING_PRECISION = getattr(settings, "EMBEDDING_PRECISION", "float32")
+    SEARCH_BACKEND = getattr(settings, "EMBEDDING_SEARCH_BACKEND", "numpy")
 except Exception:
     OPENAI_KEY = os.getenv("OPENAI_API_KEY")
     CHAT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
     TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.3"))
     SYSTEM_PROMPT_BASE = os.getenv("PROMPT_ANALISTA_SISTEMA", "Você é um analista financeiro sênior.")
+    EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "float32")
+    SEARCH_BACKEND = os.getenv("EMBEDDING_SEARCH_BACKEND", "numpy")
 
 # instanciar client
 _client_kwargs: Dict[str, Any] = {}
 if OPENAI_KEY:
     _client_kwargs["api_key"] = OPENAI_KEY
 client = OpenAI(**_client_kwargs)  # se api_key não fornecido, usará env var OPENAI_API_KEY
+# cliente assíncrono, usado só no streaming das respostas (answer_stream)
+async_client = AsyncOpenAI(**_client_kwargs)
 
-# Persistência
-DEFAULT_STORE = Path(__file__).resolve().parents[2] / "data" / "embeddings_store.pkl"  # backend/data/embeddings_store.pkl
-
+# Lotes de embedding: a API aceita até 2048 entradas e ~300k tokens por chamada
+EMBED_BATCH_SIZE = 512
+EMBED_BATCH_MAX_TOKENS = 200_000
+EMBED_MAX_WORKERS = 8
 
-@dataclass
-class DocChunk:
-    text: str
-    source: str
-    meta: Dict[str, Any] = field(default_factory=dict)
-    embedding: Optional[np.ndarray] = None
-
-    def to_serializable(self) -> Dict[str, Any]:
-        return {
-            "text": self.text,
-            "source": self.source,
-            "meta": self.meta,
-            "embedding": None if self.embedding is None else self.embedding.astype(np.float32).tolist()
-        }
+# Cache em disco das embeddings de consultas: no máximo este número de arquivos;
+# acima disso saem os usados há mais tempo (mtime, renovado a cada acerto)
+QUERY_CACHE_MAX_FILES = int(os.getenv("QUERY_CACHE_MAX_FILES", "1024"))
 
-    @staticmethod
-    def from_serializable(d: Dict[str, Any]) -> "DocChunk":
-        emb = d.get("embedding")
-        emb_arr = None if emb is None else np.array(emb, dtype=np.float32)
-        return DocChunk(text=d["text"], source=d["source"], meta=d.get("meta", {}), embedding=emb_arr)
+# Persistência
+DEFAULT_STORE = Path(__file__).resolve().parents[2] / "data" / "embeddings_store.npy"  # backend/data/embeddings_store.npy
 
 
 def chunk_text(text: str, max_chars: int = 1400) -> List[str]:
+    """
+    Agrupa linhas inteiras em partes de até max_chars caracteres (contando o
+    "\n" de cada linha), numa única passada gulosa. As linhas vão para uma
+    lista e só são unidas com "\n".join ao fechar cada parte, sem concatenar
+    strings linha a linha. Linhas maiores que max_chars são fatiadas.
+    """
     text = text.strip()
     if not text:
         return []
     if len(text) <= max_chars:
         return [text]
-    parts: List[str] = []
-    cur = ""
-    for line in text.splitlines():
-        if len(cur) + len(line) + 1 <= max_chars:
-            cur += (line + "\n")
-        else:
-            parts.append(cur.strip())
-            cur = line + "\n"
-    if cur.strip():
-        parts.append(cur.strip())
     out: List[str] = []
-    for p in parts:
-        if len(p) <= max_chars:
-            out.append(p)
+
+    def flush(buf: List[str]):
+        part = "\n".join(buf).strip()
+        if len(part) <= max_chars:
+            if part:
+                out.append(part)
+        else:
+            # linha sozinha maior que max_chars
+            out.extend(part[i:i + max_chars] for i in range(0, len(part), max_chars))
+
+    buf: List[str] = []
+    size = 0
+    for line in text.splitlines():
+        n = len(line) + 1
+        if size + n <= max_chars:
+            buf.append(line)
+            size += n
         else:
-            for i in range(0, len(p), max_chars):
-                out.append(p[i:i + max_chars])
+            if buf:
+                flush(buf)
+            buf, size = [line], n
+    if buf:
+        flush(buf)
     return out
 
 
+def token_counter(model: str) -> Callable[[str], int]:
+    """Contador de tokens do modelo; sem tiktoken, usa uma estimativa conservadora."""
+    if tiktoken is not None:
+        try:
+            enc = tiktoken.encoding_for_model(model)
+            return lambda text: len(enc.encode(text))
+        except Exception:
+            pass
+    return lambda text: len(text) // 3 + 1
+
+
+def make_batches(texts: List[str], count_tokens: Callable[[str], int], batch_size: int = EMBED_BATCH_SIZE,
+                 max_tokens: int = EMBED_BATCH_MAX_TOKENS) -> List[Tuple[int, int]]:
+    """Divide os textos em intervalos [ini, fim) limitados por quantidade e por tokens."""
+    batches: List[Tuple[int, int]] = []
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        n = count_tokens(text)
+        if i > start and (i - start >= batch_size or tokens + n > max_tokens):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+def normalize(v: np.ndarray) -> np.ndarray:
+    """L2-normaliza o vetor in-place; com isso o cosseno vira um produto escalar."""
+    v /= np.linalg.norm(v) + 1e-12
+    return v
+
+
+def quantize_int8(m: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantização simétrica int8 por linha: m ≈ q * scale[:, None].
+    Em vetores normalizados preserva o ranking do cosseno e ocupa 1/4 da memória.
+    """
+    m = np.atleast_2d(m)
+    scales = (np.abs(m).max(axis=1) / 127.0).astype(np.float32)
+    scales[scales == 0] = 1.0
+    q = np.round(m / scales[:, None]).astype(np.int8)
+    return q, scales
+
+
+def raw_embedding(item: Any) -> np.ndarray:
+    # O `item` aqui é do tipo `openai.types.embedding.Embedding`
+    # que tem um atributo `.embedding`
+    emb_raw = getattr(item, "embedding", None)
+    if emb_raw is None:
+        raise RuntimeError("[ChatAgent] não foi possível extrair embedding do item retornado pela API.")
+    if isinstance(emb_raw, str):
+        # encoding_format="base64": o buffer float32 vem pronto, sem lista de floats Python
+        return np.frombuffer(base64.b64decode(emb_raw), dtype=np.float32)
+    return np.asarray(emb_raw, dtype=np.float32)
+
+
+def extract_embedding(item: Any) -> np.ndarray:
+    return normalize(raw_embedding(item).copy())
+
+
+@lru_cache(maxsize=1024)
+def _embed_query_cached(query_text: str, model: str, cache_dir: Optional[str] = None) -> bytes:
+    """
+    Embedding (normalizada, float32) de uma consulta, em bytes para ser hashable.
+    Além do LRU em memória, guarda cada embedding em cache_dir/<sha256>.npy para
+    reaproveitar entre reinícios do processo (limitado a QUERY_CACHE_MAX_FILES arquivos).
+    """
+    path: Optional[Path] = None
+    if cache_dir:
+        key = hashlib.sha256(f"{model}\0{query_text}".encode("utf-8")).hexdigest()
+        path = Path(cache_dir) / f"{key}.npy"
+        try:
+            emb = np.load(path).astype(np.float32)
+            os.utime(path)  # marca como usado agora, para a limpeza por LRU
+            return emb.tobytes()
+        except Exception:
+            pass
+    resp: CreateEmbeddingResponse = client.embeddings.create(model=model, input=[query_text], encoding_format="base64")
+    emb = extract_embedding(resp.data[0])
+    if path is not None:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            with open(tmp, "wb") as fh:
+                np.save(fh, emb)
+            os.replace(tmp, path)
+            _prune_query_cache(path.parent, QUERY_CACHE_MAX_FILES)
+        except Exception as e:
+            print(f"[ChatAgent] falha ao gravar cache de consulta: {e}")
+    return emb.tobytes()
+
+
+def _prune_query_cache(cache_dir: Path, max_files: int):
+    """Remove os .npy usados há mais tempo quando o cache passa de max_files arquivos."""
+    with os.scandir(cache_dir) as it:
+        entries = [e for e in it if e.name.endswith(".npy") and e.is_file()]
+    excess = len(entries) - max_files
+    if excess <= 0:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime_ns)
+    for e in entries[:excess]:
+        try:
+            os.remove(e.path)
+        except FileNotFoundError:
+            pass
+
+
 def cosine_sim(a: np.ndarray, b: np.ndarray) -> float:
     return float(np.dot(a, b) / ((np.linalg.norm(a) * np.linalg.norm(b)) + 1e-12))
 
 
 class ChatAgent:
-    def __init__(self, data_dir: str | Path, embedding_model: str = EMBEDDING_MODEL, chat_model: str = CHAT_MODEL, store_path: Optional[Path] = None):
+    def __init__(self, data_dir: str | Path, embedding_model: str = EMBEDDING_MODEL, chat_model: str = CHAT_MODEL, store_path: Optional[Path] = None,
+                 precision: str = EMBEDDING_PRECISION, backend: str = SEARCH_BACKEND):
         self.data_dir = Path(data_dir)
         if not self.data_dir.exists():
             raise FileNotFoundError(f"data_dir não encontrado: {self.data_dir}")
         self.embedding_model = embedding_model
         self.chat_model = chat_model
-        self.chunks: List[DocChunk] = []
-        self.store_path = Path(store_path) if store_path else DEFAULT_STORE
+        if precision not in ("float32", "int8"):
+            raise ValueError(f"precision inválida: {precision} (use 'float32' ou 'int8')")
+        self.precision = precision
+        if backend not in ("numpy", "faiss", "simsimd"):
+            raise ValueError(f"backend inválido: {backend} (use 'numpy', 'faiss' ou 'simsimd')")
+        if backend != "numpy" and precision != "float32":
+            raise ValueError(f"precision='{precision}' só é suportada com backend='numpy'")
+        if (backend == "faiss" and faiss is None) or (backend == "simsimd" and simsimd is None):
+            print(f"[ChatAgent] backend '{backend}' não instalado — usando numpy.")
+            backend = "numpy"
+        self.backend = backend
+        self.store_path = Path(store_path).with_suffix(".npy") if store_path else DEFAULT_STORE
+        self.query_cache_dir = self.store_path.parent / "query_cache"
         self.manifest: Dict[str, Any] = {}
-        if not self._try_load_store():
-            self.reload_documents()
+        # Chunks em colunas paralelas (linha i da matriz <-> texts[i], sources[i], metas[i]).
+        # A busca só percorre a matriz (N, D) float32 normalizada; textos e metas
+        # são acessados apenas para os top_k.
+        self._matrix: np.ndarray = np.empty((0, 0), dtype=np.float32)
+        self._texts: List[str] = []
+        self._sources: List[str] = []
+        self._metas: List[Dict[str, Any]] = []
+        # com precision="int8" a busca usa a cópia quantizada da matriz
+        self._matrix_i8: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        # com backend="faiss", índice IndexFlatIP sobre a matriz normalizada
+        self._index: Any = None
+        self._system_prompt = SYSTEM_PROMPT_BASE + (
+            "\n\nVocê é um Analista Financeiro Sênior — Trader Profissional com anos de experiência. "
+            "Responda de forma objetiva, priorizando gestão de risco, clareza e indicando nível de confiança "
+            "(baixo/médio/alto). Ao mencionar recomendações, referencie as fontes (arquivos) usadas."
+        )
+        # reload_documents já tenta o store persistido antes de gerar as embeddings
+        self.reload_documents()
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self._texts)
 
     # ----------------------------
     # Document loading & chunking
     # ----------------------------
+    def _document_files(self) -> List[Path]:
+        # os .json do store não são documentos, caso o store fique dentro de data_dir
+        store_files = (self.meta_path, self.manifest_path)
+        return sorted(p for p in self.data_dir.glob("*.json") if p not in store_files)
+
+    @staticmethod
+    def _build_manifest(files: List[Path]) -> Dict[str, List[int]]:
+        """
+        Assinatura dos documentos: {nome: [tamanho, mtime_ns]}. Listas (e não
+        tuplas) para comparar direto com o manifest lido do JSON.
+        """
+        manifest: Dict[str, List[int]] = {}
+        for p in files:
+            st = p.stat()
+            manifest[p.name] = [st.st_size, st.st_mtime_ns]
+        return manifest
+
+    def documents_changed(self) -> bool:
+        """Indica se os arquivos de data_dir mudaram desde o último carregamento."""
+        return self._build_manifest(self._document_files()) != self.manifest
+
     def reload_documents(self, force_reembed: bool = False):
-        files = sorted([p for p in self.data_dir.glob("*.json")])
+        files = self._document_files()
+        manifest = self._build_manifest(files)
         if not files:
-            self.chunks = []
+            self._texts, self._sources, self._metas = [], [], []
+            self._set_matrix(np.empty((0, 0), dtype=np.float32))
             self.manifest = {}
             return
 
-        if self.store_path.exists() and not force_reembed:
-            try:
-                with open(self.store_path, "rb") as f:
-                    store = pickle.load(f)
-                stored_manifest = store.get("manifest", {})
-                current_manifest = {str(p.name): p.stat().st_mtime for p in files}
-                if stored_manifest == current_manifest:
-                    print("[ChatAgent] store disponível e manifest idêntico — usando embeddings persistidos.")
-                    self._load_chunks_from_store(store)
-                    return
-                else:
-                    print("[ChatAgent] store detectado, mas manifest mudou. Re-embeding será executado.")
-            except Exception as e:
-                print("[ChatAgent] falha lendo store (será re-embeding):", e)
-
-        new_chunks: List[DocChunk] = []
-        for p in files:
-            try:
-                with open(p, "r", encoding="utf-8") as fh:
-                    obj = json.load(fh)
-                txt = json.dumps(obj, ensure_ascii=False, indent=2)
-                parts = chunk_text(txt, max_chars=1400)
-                for i, part in enumerate(parts):
-                    new_chunks.append(DocChunk(text=part, source=p.name, meta={"file": p.name, "idx": i}))
-            except Exception as e:
-                print(f"[ChatAgent] erro lendo {p}: {e}")
+        if not force_reembed and self._try_load_store(manifest):
+            print("[ChatAgent] store disponível e manifest idêntico — usando embeddings persistidos.")
+            return
 
-        self.chunks = new_chunks
-        self._embed_all()
-        manifest = {str(p.name): p.stat().st_mtime for p in files}
+        # leitura + chunking por arquivo em paralelo; ex.map devolve na ordem dos
+        # arquivos, então os índices das embeddings continuam reprodutíveis
+        with ThreadPoolExecutor(max_workers=min(8, len(files))) as ex:
+            results = list(ex.map(self._load_and_chunk, files))
+
+        texts: List[str] = []
+        sources: List[str] = []
+        metas: List[Dict[str, Any]] = []
+        for p, parts in zip(files, results):
+            for i, part in enumerate(parts):
+                texts.append(part)
+                sources.append(p.name)
+                metas.append({"file": p.name, "idx": i})
+
+        self._texts, self._sources, self._metas = texts, sources, metas
+        self._set_matrix(self._embed_all(texts))
         self.manifest = manifest
         self.save_store()
 
+    @staticmethod
+    def _load_and_chunk(p: Path) -> List[str]:
+        try:
+            raw = p.read_bytes()
+            # só valida que é JSON; o texto do arquivo já serve para o chunking
+            dados = json_rapido.loads(raw)
+            texto = raw.decode("utf-8")
+            if len(texto) > 1400 and "\n" not in texto[:1400]:
+                # JSON compacto (uma linha só): chunk_text cortaria os registros no meio,
+                # então só esses arquivos são reindentados
+                texto = json_rapido.dumps(dados, indent=True).decode("utf-8")
+            return chunk_text(texto, max_chars=1400)
+        except Exception as e:
+            print(f"[ChatAgent] erro lendo {p}: {e}")
+            return []
+
     # ----------------------------
     # Embeddings generation & persistence
     # ----------------------------
-    def _embed_all(self, batch_size: int = 30):
-        texts = [c.text for c in self.chunks]
+    def _embed_all(self, texts: List[str], batch_size: int = EMBED_BATCH_SIZE, max_workers: int = EMBED_MAX_WORKERS) -> np.ndarray:
+        """
+        Gera as embeddings dos textos em lotes grandes (limitados por quantidade
+        e por tokens), com os lotes enviados em paralelo. Cada item da resposta
+        é escrito direto na sua linha de uma matriz (N, D) pré-alocada, que é
+        normalizada de uma vez no final e retornada.
+        """
         if not texts:
-            return
-        embeddings: List[np.ndarray] = []
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            try:
-                # A resposta da API é um objeto, não um dicionário.
-                resp: CreateEmbeddingResponse = client.embeddings.create(model=self.embedding_model, input=batch)
-                
-                # --- CORREÇÃO APLICADA AQUI ---
-                # Iteramos diretamente sobre `resp.data`, que é a lista de embeddings.
-                for item in resp.data:
-                    emb = self._extract_embedding_from_item(item)
-                    embeddings.append(emb)
+            return np.empty((0, 0), dtype=np.float32)
+        batches = make_batches(texts, token_counter(self.embedding_model), batch_size=batch_size)
 
+        def request(start: int, end: int) -> CreateEmbeddingResponse:
+            try:
+                return client.embeddings.create(model=self.embedding_model, input=texts[start:end],
+                                                encoding_format="base64")
             except Exception as e:
                 # Adicionando o traceback para um debug mais detalhado
                 import traceback
                 print(traceback.format_exc())
-                raise RuntimeError(f"[ChatAgent] erro criando embeddings (batch {i}-{i+batch_size}): {e}")
-        
-        for c, emb in zip(self.chunks, embeddings):
-            c.embedding = emb
+                raise RuntimeError(f"[ChatAgent] erro criando embeddings (batch {start}-{end}): {e}")
+
+        def fill(out: np.ndarray, start: int, resp: CreateEmbeddingResponse):
+            # A resposta da API é um objeto, não um dicionário; `resp.data` é a lista de embeddings.
+            for j, item in enumerate(resp.data):
+                out[start + j] = raw_embedding(item)
+
+        # o primeiro lote vai sozinho: a dimensão D só é conhecida na resposta
+        first_start, first_end = batches[0]
+        first = request(first_start, first_end)
+        dim = len(raw_embedding(first.data[0]))
+        out = np.empty((len(texts), dim), dtype=np.float32)
+        fill(out, first_start, first)
+
+        def embed_batch(start: int, end: int):
+            fill(out, start, request(start, end))
+
+        rest = batches[1:]
+        if rest:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(rest)))) as ex:
+                futures = [ex.submit(embed_batch, start, end) for start, end in rest]
+                for fut in as_completed(futures):
+                    fut.result()
+
+        out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-12
+        return out
 
     def _extract_embedding_from_item(self, item: Any) -> np.ndarray:
-        # O `item` aqui é do tipo `openai.types.embedding.Embedding`
-        # que tem um atributo `.embedding`
-        emb_raw = getattr(item, "embedding", None)
-        if emb_raw is None:
-            raise RuntimeError("[ChatAgent] não foi possível extrair embedding do item retornado pela API.")
-        return np.array(emb_raw, dtype=np.float32)
+        return extract_embedding(item)
 
     def _embed_query(self, query: str) -> np.ndarray:
+        # consultas repetidas saem do LRU (ou do cache em disco) sem chamar a API
         try:
-            resp: CreateEmbeddingResponse = client.embeddings.create(model=self.embedding_model, input=[query])
-            item = resp.data[0]
-            return self._extract_embedding_from_item(item)
+            raw = _embed_query_cached(query, self.embedding_model, str(self.query_cache_dir))
         except Exception as e:
             raise RuntimeError(f"[ChatAgent] erro ao criar embedding para consulta: {e}")
+        return np.frombuffer(raw, dtype=np.float32)
+
+    def _set_matrix(self, matrix: np.ndarray):
+        self._matrix = matrix
+        if self.precision == "int8" and matrix.size:
+            self._matrix_i8, self._scales = quantize_int8(matrix)
+        else:
+            self._matrix_i8, self._scales = None, None
+        self._index = None
+        if self.backend == "faiss" and matrix.size:
+            # produto interno sobre vetores normalizados = cosseno
+            self._index = faiss.IndexFlatIP(matrix.shape[1])
+            self._index.add(np.ascontiguousarray(matrix, dtype=np.float32))
+
+    def _score(self, qemb: np.ndarray) -> np.ndarray:
+        """Cosseno da consulta (normalizada) contra todas as linhas da matriz."""
+        if self.backend == "simsimd":
+            # cdist devolve a distância do cosseno (1 - similaridade), em SIMD
+            dist = np.asarray(simsimd.cdist(self._matrix, qemb[None, :], metric="cosine"), dtype=np.float32)
+            return 1.0 - dist.ravel()
+        if self._matrix_i8 is None or self._scales is None:
+            # cosseno = produto escalar, já que consulta e matriz estão normalizadas
+            return self._matrix @ qemb
+        q_i8, q_scale = quantize_int8(qemb)
+        # numpy não tem caminho BLAS para int8: einsum acumulando em int32
+        acc = np.einsum("ij,j->i", self._matrix_i8, q_i8[0], dtype=np.int32)
+        return acc * (self._scales * q_scale[0])
+
+    @property
+    def meta_path(self) -> Path:
+        return self.store_path.with_suffix(".meta.json")
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.store_path.with_suffix(".manifest.json")
 
     def save_store(self, path: Optional[Path] = None):
-        p = Path(path) if path else self.store_path
+        """
+        Persiste o store em três arquivos, sem serializar objetos Python:
+        - <nome>.npy: a matriz de embeddings float32 contígua (normalizada);
+        - <nome>.meta.json: os chunks em colunas (texts, metas e sources
+          codificadas por dicionário, já que muitos chunks vêm do mesmo arquivo);
+        - <nome>.manifest.json: o manifest dos documentos, escrito por último.
+        Os arquivos são escritos em temporários e trocados com os.replace, para
+        não invalidar um mmap do store anterior que ainda esteja em uso.
+        """
+        p = Path(path).with_suffix(".npy") if path else self.store_path
+        meta_p = p.with_suffix(".meta.json")
+        manifest_p = p.with_suffix(".manifest.json")
         try:
-            serial = {
+            codes: Dict[str, int] = {}
+            source_codes = [codes.setdefault(src, len(codes)) for src in self._sources]
+            meta = {
+                "texts": self._texts,
+                "sources": list(codes),
+                "source_codes": source_codes,
+                "metas": self._metas,
+            }
+            manifest = {
                 "manifest": self.manifest,
                 "created_at": time.time(),
-                "chunks": [c.to_serializable() for c in self.chunks]
+                "normalized": True,
+                "num_chunks": self.num_chunks,
             }
             p.parent.mkdir(parents=True, exist_ok=True)
-            with open(p, "wb") as fh:
-                pickle.dump(serial, fh)
-            print(f"[ChatAgent] store salvo em {p} (chunks={len(self.chunks)})")
+            tmp_npy = p.with_name(p.name + ".tmp")
+            tmp_meta = meta_p.with_name(meta_p.name + ".tmp")
+            tmp_manifest = manifest_p.with_name(manifest_p.name + ".tmp")
+            with open(tmp_npy, "wb") as fh:
+                np.save(fh, np.ascontiguousarray(self._matrix, dtype=np.float32))
+            with open(tmp_meta, "wb") as fh:
+                fh.write(json_rapido.dumps(meta))
+            with open(tmp_manifest, "wb") as fh:
+                fh.write(json_rapido.dumps(manifest))
+            os.replace(tmp_npy, p)
+            os.replace(tmp_meta, meta_p)
+            os.replace(tmp_manifest, manifest_p)
+            print(f"[ChatAgent] store salvo em {p} (chunks={self.num_chunks})")
         except Exception as e:
             print(f"[ChatAgent] falha ao salvar store: {e}")
 
-    def _load_chunks_from_store(self, store: Dict[str, Any]):
-        loaded_chunks = [DocChunk.from_serializable(d) for d in store.get("chunks", [])]
-        self.chunks = loaded_chunks
-        self.manifest = store.get("manifest", {})
-        print(f"[ChatAgent] carregado {len(self.chunks)} chunks do store.")
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        if not (self.manifest_path.exists() and self.meta_path.exists() and self.store_path.exists()):
+            return None
+        with open(self.manifest_path, "rb") as fh:
+            return json_rapido.loads(fh.read())
 
-    def _try_load_store(self) -> bool:
-        p = self.store_path
-        if not p.exists():
-            return False
+    def _load_chunks_from_store(self, header: Dict[str, Any]):
+        """
+        Lê as colunas do .meta.json e a matriz do .npy via mmap (as páginas só
+        são lidas do disco quando a busca as toca).
+        """
+        with open(self.meta_path, "rb") as fh:
+            meta = json_rapido.loads(fh.read())
+        texts: List[str] = meta["texts"]
+        names: List[str] = meta["sources"]
+        sources = [names[c] for c in meta["source_codes"]]
+        metas: List[Dict[str, Any]] = meta["metas"]
+        if not (len(texts) == len(sources) == len(metas) == header.get("num_chunks")):
+            raise ValueError("colunas do store com tamanhos inconsistentes")
+        if texts:
+            matrix = np.load(self.store_path, mmap_mode="r")
+            if matrix.shape[0] != len(texts):
+                raise ValueError("matriz do store não corresponde aos chunks")
+        else:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        self._texts, self._sources, self._metas = texts, sources, metas
+        self.manifest = header["manifest"]
+        self._set_matrix(matrix)
+        print(f"[ChatAgent] carregado {self.num_chunks} chunks do store.")
+
+    def _try_load_store(self, manifest: Optional[Dict[str, List[int]]] = None) -> bool:
         try:
-            with open(p, "rb") as fh:
-                store = pickle.load(fh)
-            if "manifest" not in store or "chunks" not in store:
+            header = self._read_manifest()
+            if header is None or "manifest" not in header or not header.get("normalized"):
                 return False
-            files = sorted([f for f in self.data_dir.glob("*.json")])
-            current_manifest = {str(p.name): p.stat().st_mtime for p in files}
-            stored_manifest = store.get("manifest", {})
-            if stored_manifest == current_manifest:
-                self._load_chunks_from_store(store)
-                return True
-            else:
+            if manifest is None:
+                manifest = self._build_manifest(self._document_files())
+            # só o manifest (pequeno) é lido antes de decidir; textos e matriz vêm depois
+            if header["manifest"] != manifest:
+                print("[ChatAgent] store detectado, mas manifest mudou. Re-embeding será executado.")
                 return False
+            self._load_chunks_from_store(header)
+            return True
         except Exception as e:
             print("[ChatAgent] erro carregando store:", e)
             return False
@@ -252,26 +547,31 @@ class ChatAgent:
     # Busca semântica e resposta
     # ----------------------------
     def semantic_search(self, query: str, top_k: int = 6) -> List[Dict[str, Any]]:
-        if not self.chunks:
+        if self._matrix.size == 0:
             return []
         qemb = self._embed_query(query)
-        scores: List[Tuple[float, DocChunk]] = []
-        for c in self.chunks:
-            if c.embedding is None:
-                continue
-            s = cosine_sim(qemb, c.embedding)
-            scores.append((s, c))
-        scores.sort(key=lambda x: x[0], reverse=True)
-        top = scores[:top_k]
-        return [{"score": float(s), "text": c.text, "source": c.source, "meta": c.meta} for s, c in top]
+        k = min(top_k, self._matrix.shape[0])
+        if k <= 0:
+            return []
+        if self._index is not None:
+            # o faiss já devolve os top_k ordenados
+            top_scores, top_idx = self._index.search(qemb[None, :], k)
+            pairs = [(float(sc), int(i)) for sc, i in zip(top_scores[0], top_idx[0]) if i >= 0]
+        else:
+            scores = self._score(qemb)
+            # argpartition seleciona os top_k em O(N); só esses k são ordenados
+            idx = np.argpartition(-scores, k - 1)[:k]
+            idx = idx[np.argsort(-scores[idx])]
+            pairs = [(float(scores[i]), int(i)) for i in idx]
+        return [
+            {"score": score, "text": self._texts[i], "source": self._sources[i], "meta": self._metas[i]}
+            for score, i in pairs
+        ]
 
     def build_system_prompt(self) -> str:
-        sys = SYSTEM_PROMPT_BASE + (
-            "\n\nVocê é um Analista Financeiro Sênior — Trader Profissional com anos de experiência. "
-            "Responda de forma objetiva, priorizando gestão de risco, clareza e indicando nível de confiança "
-            "(baixo/médio/alto). Ao mencionar recomendações, referencie as fontes (arquivos) usadas."
-        )
-        return sys
+        # invariável por instância: montado uma vez no __init__, o prefixo enviado
+        # é idêntico byte a byte em toda chamada (aproveita o prompt caching da OpenAI)
+        return self._system_prompt
 
     def _extract_chat_text(self, resp_obj: Any) -> str:
         """
@@ -288,10 +588,8 @@ class ChatAgent:
             pass
         return ""
 
-    def answer(self, user_message: str, top_k: int = 6, dashboard_analysis: Optional[str] = None, max_tokens: int = 500, temperature: Optional[float] = None) -> Dict[str, Any]:
-        if temperature is None:
-            temperature = TEMPERATURE
-
+    def _build_messages(self, user_message: str, top_k: int = 6,
+                        dashboard_analysis: Optional[str] = None) -> Tuple[List[ChatCompletionMessageParam], List[Dict[str, Any]]]:
         hits = self.semantic_search(user_message, top_k=top_k)
 
         ctx_parts = []
@@ -312,7 +610,14 @@ class ChatAgent:
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
-        
+        return messages_param, hits
+
+    def answer(self, user_message: str, top_k: int = 6, dashboard_analysis: Optional[str] = None, max_tokens: int = 500, temperature: Optional[float] = None) -> Dict[str, Any]:
+        if temperature is None:
+            temperature = TEMPERATURE
+
+        messages_param, hits = self._build_messages(user_message, top_k=top_k, dashboard_analysis=dashboard_analysis)
+
         try:
             resp = client.chat.completions.create(
                 model=self.chat_model,
@@ -329,6 +634,37 @@ class ChatAgent:
             "sources": [{"source": h["source"], "score": h["score"]} for h in hits]
         }
 
+    async def answer_stream(self, user_message: str, top_k: int = 6, dashboard_analysis: Optional[str] = None,
+                            max_tokens: int = 500, temperature: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Versão em streaming de answer(): devolve os pedaços do texto à medida
+        que o modelo os gera (stream=True), para o front-end exibir a resposta
+        a partir do primeiro token. Não inclui as fontes.
+        """
+        if temperature is None:
+            temperature = TEMPERATURE
+
+        # a busca semântica é síncrona (embedding da consulta + numpy): fora do event loop
+        messages_param, _ = await asyncio.to_thread(
+            self._build_messages, user_message, top_k, dashboard_analysis
+        )
+
+        try:
+            stream = await async_client.chat.completions.create(
+                model=self.chat_model,
+                messages=messages_param,
+                temperature=float(temperature),
+                max_tokens=int(max_tokens),
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+        except Exception as e:
+            raise RuntimeError(f"[ChatAgent] erro ao chamar chat completion: {e}")
+
 
 # ----------------------------
 # CLI / utilitário
@@ -348,7 +684,7 @@ if __name__ == "__main__":
         print("Forçando rebuild de documentos e embeddings...")
         agent.reload_documents(force_reembed=True)
     if args.info:
-        print("Chunks carregados:", len(agent.chunks))
+        print("Chunks carregados:", agent.num_chunks)
         print("Store_path:", agent.store_path)
         print("Manifest keys:", list(agent.manifest.keys())[:10])
     print("Pronto.")
@@ -5,7 +5,8 @@ Analisador de Mercado de Criptoativos com a API CoinMarketCap.
 
 Este script agora opera em um ciclo de atualização:
 1. Lê a lista de ativos do seu próprio arquivo de saída ('ativos_sentimentos.json').
-2. Conecta-se à API do CoinMarketCap para ATUALIZAR os dados de mercado.
+2. Conecta-se à API do CoinMarketCap para ATUALIZAR os dados de mercado
+   (uma única requisição para até 100 símbolos).
 3. Salva o resultado completo, com um novo cabeçalho de metadados,
    sobrescrevendo o arquivo 'ativos_sentimentos.json'.
 
@@ -13,8 +14,8 @@ O "sentimento" é interpretado a partir da variação de preço nas últimas 24h
 
 Pré-requisitos:
 1. Python 3.6+
-2. Bibliotecas 'requests', 'python-dotenv' instaladas
-   (`pip install requests python-dotenv`)
+2. Bibliotecas 'requests', 'python-dotenv' e 'numpy' instaladas
+   (`pip install requests python-dotenv numpy`; 'orjson' é opcional e acelera o JSON)
 3. Um arquivo .env na mesma pasta do script contendo a chave da API:
    COINMARKETCAP_API_KEY="SUA_CHAVE_AQUI"
 4. Um arquivo 'ativos_sentimentos.json' pré-existente na mesma pasta.
@@ -22,14 +23,22 @@ Pré-requisitos:
 
 import os
 import sys
-import json
 import time
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 from typing import Optional, List, Dict
 from pathlib import Path
 
+# raiz do projeto no sys.path, como em main.py: o script também roda direto
+# (python analise_sentimento/analise_sentimento.py)
+_RAIZ_PROJETO = Path(__file__).resolve().parent.parent
+if str(_RAIZ_PROJETO) not in sys.path: sys.path.insert(0, str(_RAIZ_PROJETO))
+from utils import json_rapido
+
 # --- FUNÇÃO HELPER PARA ENCONTRAR O DIRETÓRIO CORRETO ---
 def get_project_backend_dir() -> Path:
     """Encontra o diretório 'backend' do projeto de forma robusta."""
@@ -44,6 +53,29 @@ def get_project_backend_dir() -> Path:
 BACKEND_DIR = get_project_backend_dir()
 DATA_DIR = BACKEND_DIR / "data"
 
+# O endpoint de quotes aceita vários símbolos separados por vírgula
+MAX_SIMBOLOS_POR_REQUISICAO = 100
+
+# Faixas da variação de 24h (%): até -5, até -1, até 1, até 5 e acima de 5
+_LIMITES_SENTIMENTO = np.array([-5.0, -1.0, 1.0, 5.0])
+_ROTULOS_SENTIMENTO = np.array([
+    "Forte Sentimento de Baixa (Bearish)",
+    "Sentimento de Baixa (Bearish)",
+    "Sentimento Neutro",
+    "Sentimento de Alta (Bullish)",
+    "Forte Sentimento de Alta (Bullish)",
+], dtype=object)
+
+def interpret_sentiments(changes: List[Optional[float]]) -> List[str]:
+    """
+    Rótulo de sentimento para cada variação de 24h, numa única busca binária
+    vetorizada. Valores ausentes (None/NaN) viram "Indefinido".
+    """
+    valores = np.array([np.nan if c is None else c for c in changes], dtype=np.float64)
+    rotulos = _ROTULOS_SENTIMENTO[np.searchsorted(_LIMITES_SENTIMENTO, valores, side="left")]
+    rotulos[np.isnan(valores)] = "Indefinido"
+    return rotulos.tolist()
+
 class CoinMarketCapAPI:
     """
     Classe para interagir com a API v2 do CoinMarketCap.
@@ -56,38 +88,66 @@ class CoinMarketCapAPI:
         self.base_url = "https://pro-api.coinmarketcap.com"
         self.headers = {
             'Accepts': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
             'X-CMC_PRO_API_KEY': self.api_key,
         }
+        # Uma única sessão com pool de conexões (keep-alive) e retentativas para erros transitórios.
+        # raise_on_status=False: esgotadas as tentativas, a última resposta (429/5xx) é devolvida
+        # e tratada pelo status em get_assets_data, em vez de virar RetryError
         self.session = requests.Session()
         self.session.headers.update(self.headers)
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry)
+        self.session.mount("https://", adapter)
 
-    def get_asset_data(self, symbol: str) -> dict:
+    def get_assets_data(self, symbols: List[str]) -> Dict[str, dict]:
+        """
+        Busca os dados de vários ativos numa única requisição.
+        Retorna um dict {SIMBOLO: dados formatados ou dict de erro}.
+        """
         endpoint = "/v2/cryptocurrency/quotes/latest"
         url = self.base_url + endpoint
-        params = {"symbol": symbol.upper()}
-        
-        print(f"INFO: Consultando dados para o ativo: {symbol.upper()}...", file=sys.stderr)
-        
+        symbols = [s.upper() for s in symbols]
+        params = {"symbol": ",".join(symbols), "skip_invalid": "true"}
+
+        print(f"INFO: Consultando dados para {len(symbols)} ativo(s): {', '.join(symbols)}...", file=sys.stderr)
+
         try:
             response = self.session.get(url, params=params)
-            response.raise_for_status()
+            if response.status_code >= 400:
+                # sem raise_for_status: o erro sai direto do status, sem criar exceção
+                erro = {"error": "Erro HTTP ao acessar a API.", "status_code": response.status_code,
+                        "retry_after": response.headers.get("Retry-After")}
+                return {symbol: erro for symbol in symbols}
             data = response.json()
+        except Exception as e:
+            erro = {"error": "Erro inesperado na conexão.", "message": str(e)}
+            return {symbol: erro for symbol in symbols}
 
-            if 'data' in data and symbol.upper() in data['data']:
-                asset_list = data['data'][symbol.upper()]
-                if asset_list:
-                    return self._format_output(asset_list[0])
-                else:
-                    return {"error": f"O símbolo '{symbol.upper()}' foi consultado, mas a API não retornou dados."}
+        dados = data.get('data') or {}
+        resultados: Dict[str, dict] = {}
+        encontrados: Dict[str, dict] = {}
+        for symbol in symbols:
+            if symbol not in dados:
+                resultados[symbol] = {"error": "Ativo não encontrado na resposta da API."}
+            elif dados[symbol]:
+                encontrados[symbol] = dados[symbol][0]
             else:
-                return {"error": "Ativo não encontrado na resposta da API.", "raw_response": data}
-        except requests.exceptions.HTTPError as http_err:
-            return {"error": "Erro HTTP ao acessar a API.", "status_code": http_err.response.status_code, "message": str(http_err)}
-        except Exception as e:
-            return {"error": "Erro inesperado na conexão.", "message": str(e)}
+                resultados[symbol] = {"error": f"O símbolo '{symbol}' foi consultado, mas a API não retornou dados."}
+
+        # sentimento de todos os ativos do lote de uma vez
+        variacoes = [item.get('quote', {}).get('USD', {}).get("percent_change_24h") for item in encontrados.values()]
+        for (symbol, item), sentimento in zip(encontrados.items(), interpret_sentiments(variacoes)):
+            resultados[symbol] = self._format_output(item, sentimento)
+        return {symbol: resultados[symbol] for symbol in symbols}
+
+    def get_asset_data(self, symbol: str) -> dict:
+        return self.get_assets_data([symbol])[symbol.upper()]
 
-    def _format_output(self, data: dict) -> dict:
+    def _format_output(self, data: dict, sentimento: Optional[str] = None) -> dict:
         quote_data = data.get('quote', {}).get('USD', {})
+        if sentimento is None:
+            sentimento = self._interpret_sentiment_from_change(quote_data.get("percent_change_24h"))
         return {
             "asset_info": {
                 "symbol": data.get("symbol"), "name": data.get("name"),
@@ -103,18 +163,13 @@ class CoinMarketCapAPI:
                 "percent_change_1h": quote_data.get("percent_change_1h"),
                 "percent_change_24h": quote_data.get("percent_change_24h"),
                 "percent_change_7d": quote_data.get("percent_change_7d"),
-                "descricao_sentimento_24h": self._interpret_sentiment_from_change(quote_data.get("percent_change_24h"))
+                "descricao_sentimento_24h": sentimento
             },
             "fonte_dados": "CoinMarketCap API v2"
         }
         
     def _interpret_sentiment_from_change(self, change: Optional[float]) -> str:
-        if change is None: return "Indefinido"
-        if change > 5: return "Forte Sentimento de Alta (Bullish)"
-        elif change > 1: return "Sentimento de Alta (Bullish)"
-        elif change > -1: return "Sentimento Neutro"
-        elif change > -5: return "Sentimento de Baixa (Bearish)"
-        else: return "Forte Sentimento de Baixa (Bearish)"
+        return interpret_sentiments([change])[0]
 
 def load_assets() -> List[Dict]:
     """
@@ -126,8 +181,8 @@ def load_assets() -> List[Dict]:
     
     try:
         print(f"INFO: Carregando lista de ativos de '{source_file}'...", file=sys.stderr)
-        with open(source_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(source_file, 'rb') as f:
+            data = json_rapido.loads(f.read())
             if isinstance(data, list):
                 return data
             else:
@@ -138,7 +193,7 @@ def load_assets() -> List[Dict]:
         print(f"ERRO: O arquivo de origem '{source_file}' não foi encontrado.", file=sys.stderr)
         print("Certifique-se de que o arquivo 'ativos.json' existe na pasta 'backend/data/'.", file=sys.stderr)
         sys.exit(1)
-    except json.JSONDecodeError:
+    except json_rapido.JSONDecodeError:
         print(f"ERRO: O arquivo '{source_file}' não é um JSON válido.", file=sys.stderr)
         sys.exit(1)
 
@@ -162,8 +217,9 @@ def save_results_to_json(data: List[Dict]):
     }
 
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=4, ensure_ascii=False)
+        # JSON compacto: sem indentação o arquivo e o custo de serialização caem pela metade
+        with open(file_path, 'wb') as f:
+            f.write(json_rapido.dumps(output_data))
         print(f"\nSUCESSO: Os resultados foram salvos com sucesso em '{file_path}'.", file=sys.stderr)
     except IOError as e:
         print(f"\nERRO: Não foi possível salvar os resultados no arquivo '{file_path}'. Detalhes: {e}", file=sys.stderr)
@@ -189,19 +245,26 @@ def main():
         print("ERRO: Nenhum ativo para analisar foi encontrado.", file=sys.stderr)
         sys.exit(1)
         
-    resultados_finais = []
-    
+    # lista já no tamanho final (sem realocações); as sobras dos ativos ignorados são cortadas
+    resultados_finais: List[Optional[Dict]] = [None] * len(ativos_para_analise)
+    idx = 0
     for ativo in ativos_para_analise:
-        symbol = ativo.get("codigo")
-        if not symbol:
+        if not ativo.get("codigo"):
             print(f"AVISO: Ativo sem 'codigo' encontrado e será ignorado: {ativo}", file=sys.stderr)
             continue
-        
-        market_data = client.get_asset_data(symbol=symbol)
-        resultado_combinado = {**ativo, "analise_mercado": market_data}
-        resultados_finais.append(resultado_combinado)
-        
-        time.sleep(1.1) 
+        resultados_finais[idx] = dict(ativo)
+        idx += 1
+    del resultados_finais[idx:]
+
+    symbols = list(dict.fromkeys(ativo["codigo"].upper() for ativo in resultados_finais))
+    market_data: Dict[str, dict] = {}
+    for i in range(0, len(symbols), MAX_SIMBOLOS_POR_REQUISICAO):
+        if i:
+            time.sleep(1.1)  # Pausa entre lotes para respeitar os limites da API
+        market_data.update(client.get_assets_data(symbols[i:i + MAX_SIMBOLOS_POR_REQUISICAO]))
+
+    for resultado in resultados_finais:
+        resultado["analise_mercado"] = market_data[resultado["codigo"].upper()]
 
     save_results_to_json(resultados_finais)
 
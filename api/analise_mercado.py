@@ -3,65 +3,285 @@
 
 import os
 import sys
-import json
 import time
-import requests
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import importlib.util
+import httpx
 from datetime import datetime, timezone
-from typing import Optional, List, Dict
+from typing import Deque, Optional, List, Dict, Tuple
 
 # Importando configurações centralizadas e o logger
 from config import settings
 from utils.logger import log
+from utils import json_rapido
+
+# Consultas simultâneas à API e limite de requisições por minuto do plano do CMC
+CMC_MAX_CONCORRENCIA = getattr(settings, "CMC_MAX_CONCORRENCIA", 10)
+CMC_REQUISICOES_POR_MINUTO = getattr(settings, "CMC_REQUISICOES_POR_MINUTO", 30)
+# O endpoint de quotes aceita vários símbolos separados por vírgula
+CMC_MAX_SIMBOLOS_POR_REQUISICAO = 100
+# Tentativas por requisição quando a API responde 429/502
+CMC_TENTATIVAS = 3
+# HTTP/2 (multiplexação numa única conexão TLS) exige o pacote h2: `pip install httpx[http2]`
+CMC_HTTP2 = importlib.util.find_spec("h2") is not None
+CMC_LIMITES_HTTP = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+# Cache em disco das cotações, numa subpasta de data/ para não virar documento do ChatAgent
+CMC_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'cache', 'cmc_cache.json')
+
+class RateLimiter:
+    """
+    Limitador por janela deslizante: no máximo `max_requisicoes` requisições
+    iniciadas em qualquer intervalo de `janela_s` segundos.
+    """
+    def __init__(self, max_requisicoes: int, janela_s: float = 60.0):
+        self.max_requisicoes = max_requisicoes
+        self.janela_s = janela_s
+        self._inicios: Deque[float] = deque()
+        self._lock = asyncio.Lock()
+
+    async def wait_if_throttled(self):
+        async with self._lock:
+            while True:
+                agora = time.monotonic()
+                while self._inicios and agora - self._inicios[0] >= self.janela_s:
+                    self._inicios.popleft()
+                if len(self._inicios) < self.max_requisicoes:
+                    self._inicios.append(agora)
+                    return
+                await asyncio.sleep(self.janela_s - (agora - self._inicios[0]))
+
+class RateState:
+    """
+    Espaçamento adaptativo (AIMD) entre requisições, guiado pelas respostas da API.
+    Em 429/502 (ou cota zerada) o atraso cresce em `alfa` segundos; a cada
+    resposta normal ele é multiplicado por `beta`, voltando a zero quando há
+    folga. Um `Retry-After` da API vira o piso da próxima espera.
+    """
+    STATUS_THROTTLE = (429, 502)
+
+    def __init__(self, atraso_min: float = 0.0, atraso_max: float = 60.0, alfa: float = 0.5, beta: float = 0.5):
+        self.atraso_min = atraso_min
+        self.atraso_max = atraso_max
+        self.alfa = alfa
+        self.beta = beta
+        self.atraso = atraso_min
+        self._proximo_inicio = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            agora = time.monotonic()
+            inicio = max(agora, self._proximo_inicio)
+            self._proximo_inicio = inicio + self.atraso
+        if inicio > agora:
+            await asyncio.sleep(inicio - agora)
+
+    def update(self, response: httpx.Response):
+        restantes = response.headers.get("X-RateLimit-Remaining")
+        cota_zerada = restantes is not None and restantes.strip() == "0"
+        if response.status_code in self.STATUS_THROTTLE or cota_zerada:
+            self.atraso = min(self.atraso_max, self.atraso + self.alfa)
+        else:
+            self.atraso = max(self.atraso_min, self.atraso * self.beta)
+            if self.atraso < 0.01:
+                self.atraso = self.atraso_min
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                piso = min(self.atraso_max, float(retry_after))
+            except ValueError:
+                piso = self.atraso
+            self._proximo_inicio = max(self._proximo_inicio, time.monotonic() + piso)
 
 class AnalisadorMercadoCMC:
     """
     Classe para interagir com a API v2 do CoinMarketCap.
     Refatorada para ser um módulo de serviço dentro do agente.
     """
-    def __init__(self):
-        # --- CORREÇÃO APLICADA AQUI ---
-        # Usamos getattr para uma verificação mais segura, evitando AttributeError
-        api_key = getattr(settings, "COINMARKETCAP_API_KEY", None)
-        if not api_key:
-            log.critical("A chave da API do CoinMarketCap não foi encontrada nas configurações (config/settings.py).")
-            raise ValueError("COINMARKETCAP_API_KEY não configurada.")
-        
+    def __init__(self, cache_ttl_s: float = 60.0, cache_path: Optional[str] = CMC_CACHE_FILE):
+        # a presença da chave é validada na importação de config/settings.py
+        api_key = settings.COINMARKETCAP_API_KEY
         self.base_url = "https://pro-api.coinmarketcap.com"
         self.headers = {
             'Accepts': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
             'X-CMC_PRO_API_KEY': api_key,
         }
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
+        # Cliente persistente: conexões keep-alive reaproveitadas entre chamadas
+        self.session = httpx.Client(http2=CMC_HTTP2, headers=self.headers, timeout=10.0, limits=CMC_LIMITES_HTTP)
+        self._semaforo_sync = threading.BoundedSemaphore(CMC_MAX_CONCORRENCIA)
+        # Cache por símbolo: {SIMBOLO: (timestamp, dados formatados)}. Usa time.time()
+        # (e não monotonic) para que as entradas em disco valham entre reinícios.
+        self.cache_ttl_s = cache_ttl_s
+        self._cache_path = cache_path
+        self._cache_lock = threading.Lock()
+        self._cache: Dict[str, Tuple[float, dict]] = self._load_cache()
         log.info("Analisador de Mercado (CoinMarketCap) inicializado.")
 
+    def _load_cache(self) -> Dict[str, Tuple[float, dict]]:
+        if not self._cache_path or not os.path.exists(self._cache_path):
+            return {}
+        try:
+            with open(self._cache_path, 'rb') as f:
+                return {symbol: (float(ts), dados) for symbol, (ts, dados) in json_rapido.loads(f.read()).items()}
+        except Exception as e:
+            log.warning(f"Cache do CMC ignorado ({self._cache_path}): {e}")
+            return {}
+
+    def save_cache(self):
+        """
+        Grava no disco as entradas do cache ainda válidas. Chamado ao fim de
+        executar_analise_e_salvar e no encerramento da API, não a cada consulta.
+        """
+        if not self._cache_path:
+            return
+        agora = time.time()
+        # o lock evita que threads do pool gravem o mesmo .tmp ao mesmo tempo
+        with self._cache_lock:
+            validas = {s: [ts, d] for s, (ts, d) in self._cache.items() if agora - ts < self.cache_ttl_s}
+            try:
+                os.makedirs(os.path.dirname(self._cache_path), exist_ok=True)
+                tmp = self._cache_path + ".tmp"
+                with open(tmp, 'wb') as f:
+                    f.write(json_rapido.dumps(validas))
+                os.replace(tmp, self._cache_path)
+            except Exception as e:
+                log.warning(f"Não foi possível gravar o cache do CMC: {e}")
+
+    def _cache_get(self, symbol: str) -> Optional[dict]:
+        ts, dados = self._cache.get(symbol.upper(), (0.0, None))
+        if dados is not None and time.time() - ts < self.cache_ttl_s:
+            return dados
+        return None
+
+    def _cache_put(self, symbol: str, dados: dict):
+        # erros não entram no cache: a próxima chamada tenta de novo
+        if "error" not in dados:
+            with self._cache_lock:
+                self._cache[symbol.upper()] = (time.time(), dados)
+
+    def get_assets_data(self, symbols: List[str]) -> Dict[str, dict]:
+        """
+        Busca os dados de mercado de vários ativos numa única requisição (o
+        endpoint aceita símbolos separados por vírgula). Os que estão no cache
+        não são consultados. Retorna {SIMBOLO: dados formatados ou dict de erro}.
+        """
+        symbols = list(dict.fromkeys(s.upper() for s in symbols))
+        resultados, faltantes = self._split_cached(symbols)
+        if not faltantes:
+            return resultados
+
+        endpoint = "/v2/cryptocurrency/quotes/latest"
+        url = self.base_url + endpoint
+        params = {"symbol": ",".join(faltantes), "skip_invalid": "true"}
+
+        log.info(f"Consultando dados de mercado para {len(faltantes)} ativo(s): {', '.join(faltantes)}...")
+
+        try:
+            # limita as requisições simultâneas quando chamado de várias threads
+            with self._semaforo_sync:
+                response = self.session.get(url, params=params)
+            if response.status_code >= 400:
+                resultados.update(self._erro_http(faltantes, response))
+                return resultados
+            # só o cache em memória é atualizado aqui; o disco é gravado pela rotina de
+            # atualização e no encerramento da API (ver save_cache)
+            resultados.update(self._parse_response(faltantes, json_rapido.loads(response.content)))
+        except Exception as e:
+            log.opt(exception=True).error(f"Erro inesperado na API do CMC para {', '.join(faltantes)}: {e}")
+            resultados.update((symbol, {"error": "Erro inesperado na conexão."}) for symbol in faltantes)
+        return resultados
+
     def get_asset_data(self, symbol: str) -> dict:
         """Busca os dados de mercado para um ativo específico."""
+        return self.get_assets_data([symbol])[symbol.upper()]
+
+    async def get_assets_data_async(self, symbols: List[str], http: httpx.AsyncClient,
+                                    limitador: Optional[RateLimiter] = None,
+                                    rate_state: Optional[RateState] = None) -> Dict[str, dict]:
+        """
+        Versão assíncrona de get_assets_data, sobre um httpx.AsyncClient compartilhado.
+        Cada tentativa passa pelo limitador e pelo espaçamento adaptativo; respostas
+        429/502 são repetidas até CMC_TENTATIVAS vezes.
+        """
+        symbols = list(dict.fromkeys(s.upper() for s in symbols))
+        resultados, faltantes = self._split_cached(symbols)
+        if not faltantes:
+            return resultados
+
         endpoint = "/v2/cryptocurrency/quotes/latest"
         url = self.base_url + endpoint
-        params = {"symbol": symbol.upper()}
-        
-        log.info(f"Consultando dados de mercado para o ativo: {symbol.upper()}...")
-        
+        params = {"symbol": ",".join(faltantes), "skip_invalid": "true"}
+
+        log.info(f"Consultando dados de mercado para {len(faltantes)} ativo(s): {', '.join(faltantes)}...")
+
         try:
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            if 'data' in data and symbol.upper() in data['data']:
-                asset_list = data['data'][symbol.upper()]
-                if asset_list:
-                    return self._format_output(asset_list[0])
-                else:
-                    return {"error": f"O símbolo '{symbol.upper()}' foi consultado, mas a API não retornou dados."}
-            else:
-                return {"error": "Ativo não encontrado na resposta da API.", "raw_response": data}
-        except requests.exceptions.HTTPError as http_err:
-            log.error(f"Erro HTTP ao acessar a API do CMC para {symbol}: {http_err}")
-            return {"error": "Erro HTTP.", "status_code": http_err.response.status_code}
+            for tentativa in range(1, CMC_TENTATIVAS + 1):
+                if limitador is not None:
+                    await limitador.wait_if_throttled()
+                if rate_state is not None:
+                    await rate_state.wait()
+                response = await http.get(url, params=params)
+                if rate_state is not None:
+                    rate_state.update(response)
+                if response.status_code in RateState.STATUS_THROTTLE and tentativa < CMC_TENTATIVAS:
+                    log.warning(f"API do CMC limitou a consulta (HTTP {response.status_code}); tentativa {tentativa}/{CMC_TENTATIVAS}.")
+                    continue
+                break
+            if response.status_code >= 400:
+                resultados.update(self._erro_http(faltantes, response))
+                return resultados
+            resultados.update(self._parse_response(faltantes, json_rapido.loads(response.content)))
         except Exception as e:
-            log.error(f"Erro inesperado na API do CMC para {symbol}: {e}", exc_info=True)
-            return {"error": "Erro inesperado na conexão."}
+            log.opt(exception=True).error(f"Erro inesperado na API do CMC para {', '.join(faltantes)}: {e}")
+            resultados.update((symbol, {"error": "Erro inesperado na conexão."}) for symbol in faltantes)
+        return resultados
+
+    async def get_asset_data_async(self, symbol: str, http: httpx.AsyncClient,
+                                   limitador: Optional[RateLimiter] = None,
+                                   rate_state: Optional[RateState] = None) -> dict:
+        resultados = await self.get_assets_data_async([symbol], http, limitador, rate_state)
+        return resultados[symbol.upper()]
+
+    @staticmethod
+    def _erro_http(symbols: List[str], response: httpx.Response) -> Dict[str, dict]:
+        """
+        Dict de erro para respostas >= 400, montado direto do status (sem
+        raise_for_status): é o caminho comum de 429/5xx sob carga, e o
+        retry_after fica disponível para quem for repetir a consulta.
+        """
+        log.error(f"Erro HTTP {response.status_code} ao acessar a API do CMC para {', '.join(symbols)}.")
+        erro = {"error": "Erro HTTP.", "status_code": response.status_code,
+                "retry_after": response.headers.get("Retry-After")}
+        return {symbol: erro for symbol in symbols}
+
+    def _split_cached(self, symbols: List[str]) -> Tuple[Dict[str, dict], List[str]]:
+        """Separa os símbolos já presentes no cache dos que precisam ser consultados."""
+        resultados: Dict[str, dict] = {}
+        faltantes: List[str] = []
+        for symbol in symbols:
+            cached = self._cache_get(symbol)
+            if cached is not None:
+                resultados[symbol] = cached
+            else:
+                faltantes.append(symbol)
+        return resultados, faltantes
+
+    def _parse_response(self, symbols: List[str], data: dict) -> Dict[str, dict]:
+        dados = data.get('data') or {}
+        resultados: Dict[str, dict] = {}
+        for symbol in symbols:
+            if symbol not in dados:
+                resultados[symbol] = {"error": "Ativo não encontrado na resposta da API."}
+            elif dados[symbol]:
+                resultados[symbol] = self._format_output(dados[symbol][0])
+                self._cache_put(symbol, resultados[symbol])
+            else:
+                resultados[symbol] = {"error": f"O símbolo '{symbol}' foi consultado, mas a API não retornou dados."}
+        return resultados
 
     def _format_output(self, data: dict) -> dict:
         quote_data = data.get('quote', {}).get('USD', {})
@@ -93,6 +313,20 @@ class AnalisadorMercadoCMC:
         elif change > -5: return "Sentimento de Baixa (Bearish)"
         else: return "Forte Sentimento de Baixa (Bearish)"
 
+# Instância única, criada na primeira chamada: o cliente HTTP (conexões e TLS) e o
+# cache de cotações são reaproveitados entre execuções da rotina
+_cmc: Optional[AnalisadorMercadoCMC] = None
+_cmc_lock = threading.Lock()
+
+def obter_analisador_cmc() -> AnalisadorMercadoCMC:
+    """Instância compartilhada do AnalisadorMercadoCMC (rotina de atualização e dashboard)."""
+    global _cmc
+    if _cmc is None:
+        with _cmc_lock:
+            if _cmc is None:
+                _cmc = AnalisadorMercadoCMC()
+    return _cmc
+
 def _get_data_filepath() -> str:
     """Retorna o caminho absoluto para o arquivo de dados na pasta /data."""
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -103,8 +337,8 @@ def load_assets_from_file() -> List[Dict]:
     source_file = _get_data_filepath()
     try:
         log.info(f"Carregando lista de ativos de '{source_file}'...")
-        with open(source_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(source_file, 'rb') as f:
+            data = json_rapido.loads(f.read())
             if isinstance(data, dict):
                 return data.get("ativos", [])
             elif isinstance(data, list):
@@ -116,7 +350,7 @@ def load_assets_from_file() -> List[Dict]:
     except FileNotFoundError:
         log.error(f"ERRO CRÍTICO: O arquivo de origem '{source_file}' não foi encontrado.")
         return []
-    except json.JSONDecodeError:
+    except json_rapido.JSONDecodeError:
         log.error(f"ERRO CRÍTICO: O arquivo '{source_file}' não é um JSON válido.")
         return []
 
@@ -134,11 +368,63 @@ def save_results_to_json(data: List[Dict]):
         "ativos": data
     }
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=4, ensure_ascii=False)
+        # arquivo consumido por máquina: JSON compacto (sem indentação)
+        with open(file_path, 'wb') as f:
+            f.write(json_rapido.dumps(output_data))
         log.info(f"Resultados de análise de mercado salvos com sucesso em '{file_path}'.")
     except IOError as e:
         log.error(f"Não foi possível salvar os resultados no arquivo '{file_path}': {e}")
+        return
+
+    if getattr(settings, "JSON_LEGIVEL", False):
+        # cópia indentada só para leitura humana, fora de data/*.json (não vira documento do ChatAgent)
+        pretty_path = os.path.join(os.path.dirname(file_path), 'legivel', 'ativos_sentimentos.pretty.json')
+        try:
+            os.makedirs(os.path.dirname(pretty_path), exist_ok=True)
+            with open(pretty_path, 'wb') as f:
+                f.write(json_rapido.dumps(output_data, indent=True))
+        except IOError as e:
+            log.warning(f"Não foi possível salvar a cópia legível em '{pretty_path}': {e}")
+
+async def _consultar_ativos(client: AnalisadorMercadoCMC, symbols: List[str]) -> Dict[str, dict]:
+    """
+    Consulta todos os ativos em lotes de até CMC_MAX_SIMBOLOS_POR_REQUISICAO
+    símbolos, com os lotes em paralelo: um semáforo limita as requisições em
+    andamento, a janela deslizante respeita o limite por minuto da API e o
+    RateState espaça as requisições quando a API sinaliza limitação.
+    """
+    semaforo = asyncio.Semaphore(CMC_MAX_CONCORRENCIA)
+    limitador = RateLimiter(CMC_REQUISICOES_POR_MINUTO)
+    rate_state = RateState()
+    symbols = list(dict.fromkeys(s.upper() for s in symbols))
+    lotes = [symbols[i:i + CMC_MAX_SIMBOLOS_POR_REQUISICAO] for i in range(0, len(symbols), CMC_MAX_SIMBOLOS_POR_REQUISICAO)]
+
+    async with httpx.AsyncClient(http2=CMC_HTTP2, headers=client.headers, timeout=30.0, limits=CMC_LIMITES_HTTP) as http:
+        async def consultar(lote: List[str]) -> Dict[str, dict]:
+            async with semaforo:
+                return await client.get_assets_data_async(lote, http, limitador, rate_state)
+
+        resultados: Dict[str, dict] = {}
+        for parcial in await asyncio.gather(*(consultar(lote) for lote in lotes)):
+            resultados.update(parcial)
+    return resultados
+
+def _consultar_ativos_threads(client: AnalisadorMercadoCMC, symbols: List[str]) -> Dict[str, dict]:
+    """
+    Alternativa a _consultar_ativos sem asyncio, para quando a rotina é chamada
+    de dentro de um event loop já em execução (onde asyncio.run não pode ser
+    usado): os lotes vão para um pool de threads, e o semáforo dentro de
+    get_assets_data limita as requisições simultâneas.
+    """
+    symbols = list(dict.fromkeys(s.upper() for s in symbols))
+    lotes = [symbols[i:i + CMC_MAX_SIMBOLOS_POR_REQUISICAO] for i in range(0, len(symbols), CMC_MAX_SIMBOLOS_POR_REQUISICAO)]
+    resultados: Dict[str, dict] = {}
+    if not lotes:
+        return resultados
+    with ThreadPoolExecutor(max_workers=min(CMC_MAX_CONCORRENCIA, len(lotes))) as ex:
+        for parcial in ex.map(client.get_assets_data, lotes):
+            resultados.update(parcial)
+    return resultados
 
 def executar_analise_e_salvar():
     """Função orquestradora para ser chamada pelo FastAPI."""
@@ -146,26 +432,35 @@ def executar_analise_e_salvar():
     log.info("INICIANDO ROTINA DE ATUALIZAÇÃO DE ANÁLISE DE MERCADO")
     log.info("="*50)
     
-    client = AnalisadorMercadoCMC()
+    client = obter_analisador_cmc()
     ativos_para_analise = load_assets_from_file()
     
     if not ativos_para_analise:
         log.error("Nenhum ativo para analisar foi encontrado. Rotina encerrada.")
         return
 
-    resultados_finais = []
+    # lista já no tamanho final (sem realocações); as sobras dos ativos ignorados são cortadas
+    resultados_finais: List[Optional[Dict]] = [None] * len(ativos_para_analise)
+    idx = 0
     for ativo in ativos_para_analise:
-        ativo_base = {k: v for k, v in ativo.items() if k != 'analise_mercado'}
-        symbol = ativo_base.get("codigo")
-        if not symbol:
+        if not ativo.get("codigo"):
             log.warning(f"Ativo sem 'codigo' encontrado e será ignorado: {ativo}")
             continue
-        
-        market_data = client.get_asset_data(symbol=symbol)
-        resultado_combinado = {**ativo_base, "analise_mercado": market_data}
-        resultados_finais.append(resultado_combinado)
-        time.sleep(1.1)  # Pausa para respeitar os limites da API
+        resultados_finais[idx] = {k: v for k, v in ativo.items() if k != 'analise_mercado'}
+        idx += 1
+    del resultados_finais[idx:]
+
+    symbols = [a["codigo"] for a in resultados_finais]
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        market_data = asyncio.run(_consultar_ativos(client, symbols))
+    else:
+        market_data = _consultar_ativos_threads(client, symbols)
+    for resultado in resultados_finais:
+        resultado["analise_mercado"] = market_data[resultado["codigo"].upper()]
 
+    client.save_cache()
     save_results_to_json(resultados_finais)
     log.info("="*50)
     log.info("ROTINA DE ATUALIZAÇÃO DE ANÁLISE DE MERCADO CONCLUÍDA")
@@ -3,17 +3,74 @@
 from binance.client import Client
 from binance import ThreadedWebsocketManager
 from binance.exceptions import BinanceAPIException
+import numpy as np
 import pandas as pd
 from config import settings
 from utils.logger import log
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_DOWN
+import threading
 import time
-import math
+
+# Filtros de símbolo mudam raramente (escala de horas): cache LRU com TTL
+INFO_SIMBOLO_TTL_S = 3600
+INFO_SIMBOLO_MAX = 256
+# Código da Binance para "Filter failure" (LOT_SIZE, PRICE_FILTER, NOTIONAL...)
+CODIGO_ERRO_FILTRO = -1013
+# Ativos de cotação conhecidos, na ordem em que são testados contra o final do par
+QUOTE_ASSETS = ('USDT', 'BUSD', 'FDUSD', 'TUSD', 'BTC', 'ETH')
+
+
+def formatar_decimal(valor: Decimal) -> str:
+    """Decimal em notação fixa, sem zeros à direita (ex: 101.23000000 -> '101.23')."""
+    return format(valor.normalize(), 'f')
+
+
+@dataclass(slots=True)
+class SymbolMeta:
+    """Info do símbolo com filtros indexados e tick/step como Decimal (uma vez por cache)."""
+    info: dict
+    filters_by_type: dict[str, dict]
+    tick_size: Decimal | None
+    step_size: Decimal | None
+
+    @classmethod
+    def from_info(cls, info: dict) -> "SymbolMeta":
+        filters_by_type = {f.get('filterType'): f for f in info.get('filters', [])}
+        filtro_preco = filters_by_type.get('PRICE_FILTER')
+        filtro_lote = filters_by_type.get('LOT_SIZE')
+        # a API manda os filtros como strings: Decimal exato, sem ruído de float
+        return cls(
+            info=info,
+            filters_by_type=filters_by_type,
+            tick_size=Decimal(str(filtro_preco['tickSize'])) if filtro_preco else None,
+            step_size=Decimal(str(filtro_lote['stepSize'])) if filtro_lote else None,
+        )
+
+    @staticmethod
+    def _ajustar(valor: float | Decimal, step: Decimal | None) -> Decimal:
+        valor = valor if isinstance(valor, Decimal) else Decimal(str(valor))
+        if not step: return valor
+        # múltiplo do step imediatamente abaixo (nunca arredonda para cima do saldo/preço)
+        return (valor / step).to_integral_value(ROUND_DOWN) * step
+
+    def ajustar_preco(self, valor: float | Decimal) -> Decimal:
+        return self._ajustar(valor, self.tick_size)
+
+    def ajustar_quantidade(self, valor: float | Decimal) -> Decimal:
+        return self._ajustar(valor, self.step_size)
+
 
 class ClienteBinance:
     """
     Classe para encapsular todas as interações com a API da Binance.
     Agora com validações robustas de saldo e filtros (NOTIONAL / MIN_NOTIONAL).
     """
+    # Compartilhado entre instâncias (o FastAPI cria um cliente por requisição)
+    _cache_info_simbolo: "OrderedDict[str, tuple[float, SymbolMeta]]" = OrderedDict()
+    _lock_info_simbolo = threading.Lock()
+
     def __init__(self):
         self.testnet = settings.USAR_TESTNET
         self.twm = None
@@ -41,25 +98,25 @@ class ClienteBinance:
         Busca dados históricos de klines, garantindo a correta formatação e tipos de dados.
         """
         try:
-            log.info(f"Buscando {limite} klines históricos para {par} com intervalo {intervalo}...")
+            log.debug(f"Buscando {limite} klines históricos para {par} com intervalo {intervalo}...")
             klines = self.cliente.get_historical_klines(symbol=par, interval=intervalo, limit=limite)
             
-            colunas = ['open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 
-                       'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume', 
-                       'taker_buy_quote_asset_volume', 'ignore']
-            
-            df = pd.DataFrame(klines, columns=colunas)
-
-            df = df[['open_time', 'open', 'high', 'low', 'close', 'volume']]
-            df['open_time'] = pd.to_datetime(df['open_time'], unit='ms')
+            if not klines:
+                return pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume'], dtype=np.float64)
 
-            # Força a conversão das colunas para o tipo numérico (float)
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+            # Só as 5 colunas OHLCV são materializadas: numpy converte as strings
+            # numéricas da API direto para float64, sem DataFrame intermediário de 12 colunas
+            n = len(klines)
+            ts = np.fromiter((k[0] for k in klines), dtype=np.int64, count=n)
+            ohlcv = np.array([k[1:6] for k in klines], dtype=np.float64)
 
-            df.dropna(inplace=True) 
-            df.set_index('open_time', inplace=True)
-            df.sort_index(inplace=True)
+            df = pd.DataFrame(
+                ohlcv,
+                columns=['open', 'high', 'low', 'close', 'volume'],
+                index=pd.DatetimeIndex(pd.to_datetime(ts, unit='ms'), name='open_time'),
+            )
+            if not df.index.is_monotonic_increasing:
+                df.sort_index(inplace=True)
             
             return df
         
@@ -99,12 +156,28 @@ class ClienteBinance:
     # Helpers relacionados a filtros do símbolo
     # -------------------------
     def _obter_info_simbolo(self, par: str) -> dict | None:
+        meta = self._obter_meta_simbolo(par)
+        return meta.info if meta else None
+
+    def _obter_meta_simbolo(self, par: str) -> SymbolMeta | None:
+        cache = ClienteBinance._cache_info_simbolo
+        with ClienteBinance._lock_info_simbolo:
+            entrada = cache.get(par)
+            if entrada is not None and time.monotonic() - entrada[0] < INFO_SIMBOLO_TTL_S:
+                cache.move_to_end(par)
+                return entrada[1]
         try:
             info = self.cliente.get_symbol_info(par)
             if not info:
                 log.warning(f"Informações do símbolo {par} não retornaram nada.")
                 return None
-            return info
+            meta = SymbolMeta.from_info(info)
+            with ClienteBinance._lock_info_simbolo:
+                cache[par] = (time.monotonic(), meta)
+                cache.move_to_end(par)
+                while len(cache) > INFO_SIMBOLO_MAX:
+                    cache.popitem(last=False)
+            return meta
         except BinanceAPIException as e:
             log.error(f"Erro de API ao obter info do símbolo {par}: {e}")
             return None
@@ -112,38 +185,33 @@ class ClienteBinance:
             log.error(f"Erro inesperado ao obter info do símbolo {par}: {e}")
             return None
 
-    def _obter_min_notional(self, info_simbolo: dict) -> float:
+    def _invalidar_info_simbolo(self, par: str, erro: BinanceAPIException):
+        """Descarta o cache do símbolo quando a ordem foi recusada por filtro (podem ter mudado)."""
+        if getattr(erro, "code", None) == CODIGO_ERRO_FILTRO:
+            with ClienteBinance._lock_info_simbolo:
+                ClienteBinance._cache_info_simbolo.pop(par, None)
+            log.info(f"Cache de filtros do símbolo {par} invalidado após erro de filtro.")
+
+    def _obter_min_notional(self, info_simbolo: dict, filters_by_type: dict[str, dict] | None = None) -> float:
         """
         Retorna o minNotional (em quote asset, ex: USDT) do símbolo se existir.
-        Suporta ambos: filterType 'MIN_NOTIONAL' ou 'NOTIONAL' (variações de API).
+        Suporta ambos: filterType 'MIN_NOTIONAL' ou 'NOTIONAL' (variações de API),
+        com o valor na chave 'minNotional' ou, em algumas variantes, 'notional'.
         """
-        try:
-            for f in info_simbolo.get('filters', []):
-                if f.get('filterType') in ('MIN_NOTIONAL', 'NOTIONAL'):
-                    # Alguns filtros usam 'minNotional', outros 'minNotional' como string
-                    min_notional = f.get('minNotional') or f.get('minNotional', None)
-                    if min_notional is None:
-                        # Em alguns mercados a chave pode ser 'notional' ou 'minNotional' dentro do filtro
-                        min_notional = f.get('minNotional') or f.get('minNotional')
-                    if min_notional is None:
-                        # tentativa por chaves alternativas
-                        min_notional = f.get('minNotional') or f.get('minNotional')
+        if filters_by_type is None:
+            filters_by_type = {f.get('filterType'): f for f in info_simbolo.get('filters', ())}
+        for tipo in ('MIN_NOTIONAL', 'NOTIONAL'):
+            f = filters_by_type.get(tipo)
+            if f is None:
+                continue
+            for chave in ('minNotional', 'notional'):
+                valor = f.get(chave)
+                if valor is not None:
                     try:
-                        return float(f.get('minNotional') or f.get('minNotional') or f.get('minNotional', 0.0))
-                    except Exception:
-                        # se não conseguir parse, continua (tratamento abaixo)
+                        return float(valor)
+                    except (TypeError, ValueError):
                         pass
-
-            # fallback: procurar por 'minNotional' direto (algumas exchanges / versões)
-            for f in info_simbolo.get('filters', []):
-                if 'minNotional' in f:
-                    try:
-                        return float(f['minNotional'])
-                    except Exception:
-                        continue
-            return 0.0
-        except Exception:
-            return 0.0
+        return 0.0
 
     # -------------------------
     # Websocket (sem alterações significativas)
@@ -169,13 +237,10 @@ class ClienteBinance:
             log.info(f"Tentativa de compra: {par} com {quantidade_usdt} (quoteOrderQty).")
 
             # determina asset de quote: normalmente símbolos terminam com 'USDT' ou 'BUSD' etc.
-            if par.endswith("USDT"):
-                quote_asset = "USDT"
-            elif par.endswith("BUSD"):
-                quote_asset = "BUSD"
-            else:
-                # fallback: assume últimos 3 ou 4 chars (tenta USDT ou a parte final)
-                quote_asset = par[-4:] if par[-4:] in ("USDT",) else par[-3:]
+            quote_asset = next((q for q in QUOTE_ASSETS if par.endswith(q)), None)
+            if quote_asset is None:
+                # fallback: assume os últimos 3 chars
+                quote_asset = par[-3:]
 
             saldo_disponivel = self.obter_saldo_ativo(quote_asset)
             if saldo_disponivel <= 0:
@@ -183,12 +248,12 @@ class ClienteBinance:
                 return None
 
             # recupera informações do símbolo para checar minNotional
-            info_simbolo = self._obter_info_simbolo(par)
-            if not info_simbolo:
+            meta = self._obter_meta_simbolo(par)
+            if not meta:
                 log.error(f"Não foi possível obter info do símbolo {par}. Abortando ordem de compra.")
                 return None
 
-            min_notional = self._obter_min_notional(info_simbolo)
+            min_notional = self._obter_min_notional(meta.info, meta.filters_by_type)
             # Alguns mercados apresentam min_notional em formatos diferentes; garantimos float
             try:
                 min_notional = float(min_notional)
@@ -226,6 +291,7 @@ class ClienteBinance:
         except BinanceAPIException as e:
             # Mensagens de API retornam erros específicos (NOTIONAL, INSUFFICIENT_BALANCE, etc)
             log.error(f"Erro de API ao criar ordem de compra para {par}: {e}")
+            self._invalidar_info_simbolo(par, e)
             return None
         except Exception as e:
             log.error(f"Erro inesperado ao criar ordem de compra para {par}: {e}")
@@ -236,50 +302,28 @@ class ClienteBinance:
     # -------------------------
     def criar_ordem_venda_oco(self, par: str, quantidade: float, preco_compra: float) -> dict | None:
         try:
-            info_simbolo = self._obter_info_simbolo(par)
-            if not info_simbolo: return None
-            
-            filtro_preco = next((f for f in info_simbolo['filters'] if f['filterType'] == 'PRICE_FILTER'), None)
-            filtro_lote = next((f for f in info_simbolo['filters'] if f['filterType'] == 'LOT_SIZE'), None)
-            if not filtro_preco or not filtro_lote: return None
+            meta = self._obter_meta_simbolo(par)
+            if not meta or meta.tick_size is None or meta.step_size is None: return None
 
-            tick_size = float(filtro_preco['tickSize'])
-            step_size = float(filtro_lote['stepSize'])
+            preco_take_profit = meta.ajustar_preco(preco_compra * settings.FATOR_TAKE_PROFIT)
+            preco_stop_loss = meta.ajustar_preco(preco_compra * (1 - settings.PERCENTUAL_STOP_LOSS))
+            preco_stop_limit = meta.ajustar_preco(preco_stop_loss * Decimal("0.998"))
+            quantidade_ajustada = meta.ajustar_quantidade(quantidade)
 
-            def ajustar_valor(valor, step):
-                if step == 0: return valor
-                # determina casas decimais do step (ex: 0.001 -> 3)
-                try:
-                    precisao = abs(int(round(math.log10(step))))
-                except Exception:
-                    # fallback para string parsing
-                    s = str(step)
-                    if '.' in s:
-                        precisao = len(s.split('.')[1])
-                    else:
-                        precisao = 0
-                # ajustar para o múltiplo do step
-                multiplo = math.floor(valor / step)
-                return round(multiplo * step, precisao)
-
-            preco_take_profit = ajustar_valor(preco_compra * settings.FATOR_TAKE_PROFIT, tick_size)
-            preco_stop_loss = ajustar_valor(preco_compra * (1 - settings.PERCENTUAL_STOP_LOSS), tick_size)
-            preco_stop_limit = ajustar_valor(preco_stop_loss * 0.998, tick_size)
-            quantidade_ajustada = ajustar_valor(quantidade, step_size)
-
-            log.info(f"Criando ordem OCO para {par} | Qtd: {quantidade_ajustada} | TP: {preco_take_profit} | SL: {preco_stop_loss}")
+            log.info(f"Criando ordem OCO para {par} | Qtd: {formatar_decimal(quantidade_ajustada)} | TP: {formatar_decimal(preco_take_profit)} | SL: {formatar_decimal(preco_stop_loss)}")
             
             ordem_oco = self.cliente.create_oco_order(
                 symbol=par, side=Client.SIDE_SELL,
-                quantity=f"{quantidade_ajustada:.8f}".rstrip('0').rstrip('.'),
-                price=f"{preco_take_profit:.8f}".rstrip('0').rstrip('.'),
-                stopPrice=f"{preco_stop_loss:.8f}".rstrip('0').rstrip('.'),
-                stopLimitPrice=f"{preco_stop_limit:.8f}".rstrip('0').rstrip('.'),
+                quantity=formatar_decimal(quantidade_ajustada),
+                price=formatar_decimal(preco_take_profit),
+                stopPrice=formatar_decimal(preco_stop_loss),
+                stopLimitPrice=formatar_decimal(preco_stop_limit),
                 stopLimitTimeInForce=Client.TIME_IN_FORCE_GTC
             )
             return ordem_oco
         except BinanceAPIException as e:
             log.error(f"Erro de API ao criar ordem OCO para {par}: {e}")
+            self._invalidar_info_simbolo(par, e)
             return None
         except Exception as e:
             log.error(f"Erro inesperado ao criar ordem OCO para {par}: {e}")
@@ -287,30 +331,14 @@ class ClienteBinance:
 
     def criar_ordem_venda_mercado(self, par: str, quantidade: float) -> dict | None:
         try:
-            info_simbolo = self._obter_info_simbolo(par)
-            if not info_simbolo: return None
-            filtro_lote = next((f for f in info_simbolo['filters'] if f['filterType'] == 'LOT_SIZE'), None)
-            if not filtro_lote: return None
-            step_size = float(filtro_lote['stepSize'])
-            
-            def ajustar_valor(valor, step):
-                if step == 0: return valor
-                try:
-                    precisao = abs(int(round(math.log10(step))))
-                except Exception:
-                    s = str(step)
-                    if '.' in s:
-                        precisao = len(s.split('.')[1])
-                    else:
-                        precisao = 0
-                multiplo = math.floor(valor / step)
-                return round(multiplo * step, precisao)
-
-            quantidade_ajustada = ajustar_valor(quantidade, step_size)
-            ordem = self.cliente.order_market_sell(symbol=par, quantity=quantidade_ajustada)
+            meta = self._obter_meta_simbolo(par)
+            if not meta or meta.step_size is None: return None
+            quantidade_ajustada = meta.ajustar_quantidade(quantidade)
+            ordem = self.cliente.order_market_sell(symbol=par, quantity=formatar_decimal(quantidade_ajustada))
             return ordem
         except BinanceAPIException as e:
             log.error(f"Erro de API ao criar ordem de venda para {par}: {e}")
+            self._invalidar_info_simbolo(par, e)
             return None
         except Exception as e:
             log.error(f"Erro inesperado ao criar ordem de venda para {par}: {e}")
@@ -1,12 +1,21 @@
 # backend/api/chat_agent_router.py
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, ValidationError
 from pathlib import Path
 import os
 
 from agent.chat_agent import ChatAgent
+from utils import json_rapido
 
-router = APIRouter()
+try:
+    from config import settings  # type: ignore
+    CHAT_PULAR_VALIDACAO = getattr(settings, "CHAT_PULAR_VALIDACAO", False)
+except Exception:
+    CHAT_PULAR_VALIDACAO = os.getenv("CHAT_PULAR_VALIDACAO", "False").lower() in ('true', '1', 't')
+
+# respostas serializadas com orjson (evita o jsonable_encoder + json.dumps do JSONResponse)
+router = APIRouter(default_response_class=ORJSONResponse)
 
 # ajustar data_dir para seu backend/data
 HERE = Path(__file__).resolve().parents[1]  # backend/
@@ -16,13 +25,54 @@ DATA_DIR = HERE / "data"
 agent = ChatAgent(data_dir=DATA_DIR)
 
 class ChatRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     message: str
     dashboard_analysis: str | None = None
     top_k: int | None = 6
     temperature: float | None = None
+    stream: bool = False
 
-@router.post("/agent/chat")
-async def post_chat(req: ChatRequest):
+async def ler_chat_request(request: Request) -> ChatRequest:
+    """
+    Lê o corpo cru com orjson. Com CHAT_PULAR_VALIDACAO ativo (chamadores internos
+    confiáveis) monta o ChatRequest sem validar; caso contrário valida normalmente.
+    """
+    try:
+        data = json_rapido.loads(await request.body())
+    except json_rapido.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"JSON inválido: {e}")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail="O corpo deve ser um objeto JSON.")
+    if CHAT_PULAR_VALIDACAO:
+        return ChatRequest.model_construct(**data)
+    try:
+        return ChatRequest.model_validate(data)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+# o corpo é lido por ler_chat_request (e não como parâmetro ChatRequest), então o
+# schema é declarado à mão para continuar aparecendo no OpenAPI e no /docs
+_CHAT_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": ChatRequest.model_json_schema()}},
+    }
+}
+
+@router.post("/agent/chat", openapi_extra=_CHAT_REQUEST_BODY)
+async def post_chat(req: ChatRequest = Depends(ler_chat_request)):
+    if req.stream:
+        # texto puro, enviado pedaço a pedaço conforme o modelo gera
+        return StreamingResponse(
+            agent.answer_stream(
+                user_message=req.message,
+                top_k=req.top_k or 6,
+                dashboard_analysis=req.dashboard_analysis,
+                temperature=req.temperature
+            ),
+            media_type="text/plain; charset=utf-8"
+        )
     try:
         result = agent.answer(
             user_message=req.message,
@@ -39,6 +89,6 @@ async def post_chat(req: ChatRequest):
 async def reload_index():
     try:
         agent.reload_documents()
-        return {"status": "ok", "loaded_chunks": len(agent.chunks)}
+        return {"status": "ok", "loaded_chunks": agent.num_chunks}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -11,6 +11,8 @@ USAR_TESTNET = os.getenv("USAR_TESTNET", "False").lower() in ('true', '1', 't')
 
 # --- CoinMarketCap API (CORREÇÃO) ---
 COINMARKETCAP_API_KEY = os.getenv("COINMARKETCAP_API_KEY")
+CMC_MAX_CONCORRENCIA = int(os.getenv("CMC_MAX_CONCORRENCIA", "10"))
+CMC_REQUISICOES_POR_MINUTO = int(os.getenv("CMC_REQUISICOES_POR_MINUTO", "30"))  # plano Basic do CMC
 
 # --- IA (Opcional) ---
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -18,8 +20,22 @@ OPENAI_MODEL = "gpt-4-turbo-preview"
 PROMPT_ANALISTA_SISTEMA = "Você é um analista financeiro de criptoativos."
 OPENAI_RESPONSE_FORMAT = {"type": "json_object"}
 OPENAI_TEMPERATURE = 0.3
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "4"))  # chamadas simultâneas do AnalistaFinanceiro
+OPENAI_BATCH_INTERVALO_S = int(os.getenv("OPENAI_BATCH_INTERVALO_S", "300"))  # verificação dos lotes da Batch API
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "20"))  # timeout por chamada do AnalistaFinanceiro
+OPENAI_CACHE_TTL_S = float(os.getenv("OPENAI_CACHE_TTL_S", "55"))  # respostas idênticas da IA reaproveitadas (< 1 candle de 1m)
+# "int8" guarda uma cópia quantizada das embeddings do ChatAgent (1/4 da memória na busca)
+EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "float32")
+# Busca do ChatAgent: "numpy" (padrão), "faiss" (pip install faiss-cpu) ou "simsimd" (pip install simsimd)
+EMBEDDING_SEARCH_BACKEND = os.getenv("EMBEDDING_SEARCH_BACKEND", "numpy")
+# Se True, /api/agent/chat monta o ChatRequest sem validação (apenas para chamadores internos confiáveis)
+CHAT_PULAR_VALIDACAO = os.getenv("CHAT_PULAR_VALIDACAO", "False").lower() in ('true', '1', 't')
 
 
+# --- Arquivos de dados ---
+# Se True, grava também uma cópia indentada dos JSONs gerados em data/legivel/ (para leitura humana)
+JSON_LEGIVEL = os.getenv("JSON_LEGIVEL", "False").lower() in ('true', '1', 't')
+
 # --- Modo de Operação ---
 MODO_ANALISE = True  # Se True, o bot apenas analisa e não executa trades.
 
@@ -44,3 +60,5 @@ PERCENTUAL_STOP_LOSS = 0.02
 
 if not API_KEY or not API_SECRET:
     raise ValueError("As variáveis de ambiente BINANCE_API_KEY e BINANCE_API_SECRET não foram definidas.")
+if not COINMARKETCAP_API_KEY:
+    raise ValueError("A variável de ambiente COINMARKETCAP_API_KEY não foi definida.")
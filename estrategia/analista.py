@@ -1,19 +1,59 @@
 # /backend/estrategia/analista.py
 import os
 import json
-import re
-from openai import OpenAI
+import asyncio
+import hashlib
+from functools import lru_cache
+from cachetools import TTLCache
+import openai
+from openai import AsyncOpenAI
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 from config import settings
+from utils import json_rapido
 from utils.logger import log
 
 
 # --- Caminho para a pasta de dados ---
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 
+# Limita as chamadas simultâneas à OpenAI (dashboard + lotes), para não estourar o rate limit
+OPENAI_CONCURRENCY = int(getattr(settings, "OPENAI_CONCURRENCY", 4))
+_semaforo_openai = asyncio.Semaphore(OPENAI_CONCURRENCY)
+
+# Erros transitórios da OpenAI (429, timeout, conexão, 5xx) repetidos com backoff exponencial + jitter
+OPENAI_TENTATIVAS = 3
+OPENAI_TIMEOUT_S = float(getattr(settings, "OPENAI_TIMEOUT_S", 20.0))
+_ERROS_TRANSITORIOS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+def _log_nova_tentativa(estado) -> None:
+    log.warning(
+        f"Falha transitória na OpenAI ({estado.outcome.exception()!r}); "
+        f"tentativa {estado.attempt_number}/{OPENAI_TENTATIVAS}."
+    )
+
+# Mensagem de sistema montada uma vez (igual em todas as requisições)
+_MENSAGEM_SISTEMA = {"role": "system", "content": settings.PROMPT_ANALISTA_SISTEMA}
+
+# Respostas da IA por hash do prompt: pedidos idênticos dentro do TTL não repetem a chamada
+OPENAI_CACHE_TTL_S = float(getattr(settings, "OPENAI_CACHE_TTL_S", 55))
+
+@lru_cache(maxsize=256)
+def _serializar_info_base(itens: Tuple[Tuple[str, Any], ...]) -> str:
+    """JSON indentado dos dados cadastrais do ativo (codigo, nome, tipo...), quase estáticos por par."""
+    return json_rapido.dumps(dict(itens), indent=True).decode()
+
+# Decodifica o objeto JSON que começa no primeiro "{" de uma resposta com texto em volta e
+# para no fim dele (raw_decode respeita strings JSON, ignorando chaves dentro delas)
+_DECODIFICADOR_JSON = json.JSONDecoder()
+
+# Lotes enviados à Batch API e ainda não processados (sobrevive a reinícios do servidor)
+LOTES_PENDENTES_FILE = DATA_DIR / "cache" / "lotes_ia_pendentes.json"
+_lock_lotes = asyncio.Lock()
+
 
 def salvar_analise_ia(par: str, analise: dict) -> None:
     """
@@ -48,13 +88,33 @@ def salvar_analise_ia(par: str, analise: dict) -> None:
     output_data["texto_formatado_dashboard"] = texto_formatado
 
     try:
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(output_data, f, indent=4, ensure_ascii=False)
-        log.info(f"Análise da IA para {par} salva com sucesso em '{file_path}'.")
+        with open(file_path, "wb") as f:
+            f.write(json_rapido.dumps(output_data, indent=True))
+        log.debug(f"Análise da IA para {par} salva com sucesso em '{file_path}'.")
     except IOError as e:
         log.error(f"Não foi possível salvar a análise da IA para {par}: {e}")
 
 
+def _carregar_lotes_pendentes() -> List[str]:
+    try:
+        with open(LOTES_PENDENTES_FILE, "rb") as f:
+            return json_rapido.loads(f.read())
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        log.warning(f"Lista de lotes pendentes ignorada ({LOTES_PENDENTES_FILE}): {e}")
+        return []
+
+
+def _salvar_lotes_pendentes(lotes: List[str]) -> None:
+    try:
+        LOTES_PENDENTES_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(LOTES_PENDENTES_FILE, "wb") as f:
+            f.write(json_rapido.dumps(lotes))
+    except IOError as e:
+        log.error(f"Não foi possível salvar a lista de lotes pendentes: {e}")
+
+
 class AnalistaFinanceiro:
     """
     Classe que utiliza um LLM (modelo de linguagem) para analisar dados técnicos
@@ -66,75 +126,229 @@ class AnalistaFinanceiro:
             if not settings.OPENAI_API_KEY:
                 raise ValueError("A variável de ambiente OPENAI_API_KEY não foi definida.")
             
-            self.cliente = OpenAI(api_key=settings.OPENAI_API_KEY)
+            # as retentativas ficam com o tenacity (_criar_completion), não com o cliente
+            self.cliente = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+            self._cache_respostas: TTLCache = TTLCache(maxsize=256, ttl=OPENAI_CACHE_TTL_S)
             log.info(f"Analista Financeiro (IA) inicializado com o modelo: {settings.OPENAI_MODEL}")
         except Exception as e:
-            log.critical(f"Falha ao inicializar o Analista Financeiro: {e}", exc_info=True)
+            log.opt(exception=True).critical(f"Falha ao inicializar o Analista Financeiro: {e}")
             self.cliente = None
 
-    def obter_analise(self, dados_tecnicos: Dict[str, Any], info_ativo: Dict[str, Any]) -> Dict[str, Any]:
+    async def obter_analise(self, dados_tecnicos: Dict[str, Any], info_ativo: Dict[str, Any]) -> Dict[str, Any]:
         if not self.cliente:
             return self._gerar_resposta_fallback("Cliente OpenAI indisponível.")
 
         prompt_usuario = self._construir_prompt_usuario(dados_tecnicos, info_ativo)
+        chave_cache = hashlib.blake2b(prompt_usuario.encode("utf-8"), digest_size=16).digest()
+        analise_cache = self._cache_respostas.get(chave_cache)
+        if analise_cache is not None:
+            log.debug(f"Análise da IA para {info_ativo.get('par', 'N/A')} reaproveitada do cache.")
+            return analise_cache
 
         try:
-            log.info(f"Enviando dados do par {info_ativo.get('par', 'N/A')} para análise completa...")
-
-            resposta = self.cliente.chat.completions.create(
-                model=settings.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": settings.PROMPT_ANALISTA_SISTEMA},
-                    {"role": "user", "content": prompt_usuario}
-                ],
-                response_format={"type": "json_object"},
-                temperature=settings.OPENAI_TEMPERATURE,
-                max_tokens=2048,
-            )
+            log.debug(f"Enviando dados do par {info_ativo.get('par', 'N/A')} para análise completa...")
 
-            conteudo_resposta = resposta.choices[0].message.content
-            if not conteudo_resposta:
-                raise ValueError("A resposta do LLM estava vazia.")
-            
-            try:
-                start_index = conteudo_resposta.find('{')
-                end_index = conteudo_resposta.rfind('}')
-                if start_index != -1 and end_index != -1 and end_index > start_index:
-                    json_str = conteudo_resposta[start_index:end_index+1]
-                    analise_json = json.loads(json_str)
-                else:
-                    raise ValueError("Nenhum objeto JSON válido encontrado na resposta.")
-            except (json.JSONDecodeError, ValueError) as e:
-                log.error(f"Falha ao decodificar o JSON da resposta da IA. Erro: {e}")
-                log.debug(f"Resposta recebida da IA:\n---\n{conteudo_resposta}\n---")
-                raise
-
-            salvar_analise_ia(par=info_ativo.get("par", "desconhecido"), analise=analise_json)
+            async with _semaforo_openai:
+                resposta = await self._criar_completion(self._corpo_requisicao(prompt_usuario))
+
+            analise_json = self._extrair_json(resposta.choices[0].message.content)
+
+            # gravação em disco fora do event loop
+            await asyncio.to_thread(salvar_analise_ia, info_ativo.get("par", "desconhecido"), analise_json)
 
             acao_log = analise_json.get('acao') or analise_json.get('recomendacao', 'N/A')
             confianca_log = analise_json.get('confianca', 'N/A')
 
-            log.info(
+            log.debug(
                 f"Análise da IA concluída para {info_ativo.get('par')}: "
                 f"Ação={acao_log}, Confiança={confianca_log}"
             )
 
+            self._cache_respostas[chave_cache] = analise_json
             return analise_json
 
         except Exception as e:
-            log.error(f"Erro ao obter análise da IA: {e}", exc_info=True)
+            log.opt(exception=True).error(f"Erro ao obter análise da IA: {e}")
             return self._gerar_resposta_fallback(str(e))
+
+    @retry(
+        stop=stop_after_attempt(OPENAI_TENTATIVAS),
+        wait=wait_exponential_jitter(initial=0.3, max=4),
+        retry=retry_if_exception_type(_ERROS_TRANSITORIOS),
+        before_sleep=_log_nova_tentativa,
+        reraise=True,
+    )
+    async def _criar_completion(self, corpo: Dict[str, Any]):
+        # timeout por chamada corta a cauda longa de latência (o padrão do cliente é 10 min)
+        return await self.cliente.with_options(timeout=OPENAI_TIMEOUT_S).chat.completions.create(**corpo)
+
+    async def obter_analises_lote(self, lista_ativos: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Analisa vários ativos em paralelo. Recebe pares (dados_tecnicos, info_ativo)
+        e devolve as análises na mesma ordem; o semáforo do módulo limita quantas
+        chamadas à OpenAI ficam em andamento ao mesmo tempo.
+        """
+        tarefas = [self.obter_analise(dados_tecnicos, info_ativo) for dados_tecnicos, info_ativo in lista_ativos]
+        resultados = await asyncio.gather(*tarefas, return_exceptions=True)
+        return [
+            self._gerar_resposta_fallback(str(r)) if isinstance(r, BaseException) else r
+            for r in resultados
+        ]
+
+    async def submeter_lote(self, lista_ativos: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> Optional[str]:
+        """
+        Envia as análises de vários ativos pela Batch API da OpenAI (metade do custo,
+        uma única requisição de upload), para varreduras agendadas sem usuário esperando.
+        Recebe pares (dados_tecnicos, info_ativo) e devolve o id do lote, que fica
+        registrado para verificar_lotes buscar o resultado depois.
+        """
+        if not self.cliente:
+            log.error("Cliente OpenAI indisponível; lote não enviado.")
+            return None
+        if not lista_ativos:
+            return None
+
+        linhas = []
+        for dados_tecnicos, info_ativo in lista_ativos:
+            par = info_ativo.get("par") or info_ativo.get("codigo", "desconhecido")
+            linhas.append(json_rapido.dumps({
+                "custom_id": par,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._corpo_requisicao(self._construir_prompt_usuario(dados_tecnicos, info_ativo)),
+            }))
+
+        try:
+            arquivo = await self.cliente.files.create(
+                file=("analises_ia.jsonl", b"\n".join(linhas)),
+                purpose="batch",
+            )
+            lote = await self.cliente.batches.create(
+                input_file_id=arquivo.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+            )
+        except Exception as e:
+            log.opt(exception=True).error(f"Falha ao enviar o lote de análises para a OpenAI: {e}")
+            return None
+
+        async with _lock_lotes:
+            pendentes = await asyncio.to_thread(_carregar_lotes_pendentes)
+            pendentes.append(lote.id)
+            await asyncio.to_thread(_salvar_lotes_pendentes, pendentes)
+        log.info(f"Lote {lote.id} enviado à Batch API com {len(linhas)} análise(s).")
+        return lote.id
+
+    async def verificar_lotes(self) -> int:
+        """
+        Consulta os lotes pendentes; para os concluídos, baixa o arquivo de saída e
+        salva a análise de cada ativo com salvar_analise_ia. Lotes que falharam,
+        expiraram ou foram cancelados saem da lista. Retorna quantas análises foram salvas.
+        """
+        if not self.cliente:
+            return 0
+        async with _lock_lotes:
+            return await self._verificar_lotes_pendentes()
+
+    async def _verificar_lotes_pendentes(self) -> int:
+        pendentes = await asyncio.to_thread(_carregar_lotes_pendentes)
+        if not pendentes:
+            return 0
+
+        salvas = 0
+        restantes: List[str] = []
+        for lote_id in pendentes:
+            try:
+                lote = await self.cliente.batches.retrieve(lote_id)
+            except Exception as e:
+                log.warning(f"Não foi possível consultar o lote {lote_id}: {e}")
+                restantes.append(lote_id)
+                continue
+
+            if lote.status in ("failed", "expired", "cancelled"):
+                log.error(f"Lote {lote_id} terminou com status '{lote.status}' e será descartado.")
+                continue
+            if lote.status != "completed":
+                restantes.append(lote_id)
+                continue
+
+            if lote.output_file_id:
+                conteudo = await self.cliente.files.content(lote.output_file_id)
+                salvas += await asyncio.to_thread(self._processar_saida_lote, conteudo.text)
+            log.info(f"Lote {lote_id} concluído.")
+
+        await asyncio.to_thread(_salvar_lotes_pendentes, restantes)
+        return salvas
+
+    def _processar_saida_lote(self, saida_jsonl: str) -> int:
+        """Lê o JSONL de saída da Batch API e salva cada análise; retorna quantas deram certo."""
+        salvas = 0
+        for linha in saida_jsonl.splitlines():
+            if not linha.strip():
+                continue
+            item = json_rapido.loads(linha)
+            par = item.get("custom_id", "desconhecido")
+            try:
+                if item.get("error"):
+                    raise ValueError(item["error"])
+                corpo = item["response"]["body"]
+                analise_json = self._extrair_json(corpo["choices"][0]["message"]["content"])
+            except Exception as e:
+                log.error(f"Análise do lote para {par} falhou: {e}")
+                continue
+            salvar_analise_ia(par=par, analise=analise_json)
+            salvas += 1
+        return salvas
+
+    def _corpo_requisicao(self, prompt_usuario: str) -> Dict[str, Any]:
+        """Parâmetros do chat completion, iguais no modo em tempo real e na Batch API."""
+        return {
+            "model": settings.OPENAI_MODEL,
+            "messages": [_MENSAGEM_SISTEMA, {"role": "user", "content": prompt_usuario}],
+            "response_format": {"type": "json_object"},
+            "temperature": settings.OPENAI_TEMPERATURE,
+            "max_tokens": 2048,
+        }
+
+    def _extrair_json(self, conteudo_resposta: Optional[str]) -> Dict[str, Any]:
+        if not conteudo_resposta:
+            raise ValueError("A resposta do LLM estava vazia.")
+        # com response_format=json_object a resposta já é o objeto: tenta direto, sem varrer o texto
+        try:
+            analise_json = json_rapido.loads(conteudo_resposta)
+            if isinstance(analise_json, dict):
+                return analise_json
+        except json_rapido.JSONDecodeError:
+            pass
+        # resposta com texto em volta do JSON: decodifica a partir do primeiro "{"
+        try:
+            inicio = conteudo_resposta.find("{")
+            if inicio == -1:
+                raise ValueError("Nenhum objeto JSON válido encontrado na resposta.")
+            analise_json, _ = _DECODIFICADOR_JSON.raw_decode(conteudo_resposta, inicio)
+            if not isinstance(analise_json, dict):
+                raise ValueError("A resposta da IA não contém um objeto JSON.")
+            return analise_json
+        except (json_rapido.JSONDecodeError, ValueError) as e:
+            log.error(f"Falha ao decodificar o JSON da resposta da IA. Erro: {e}")
+            # resposta inteira só é formatada se o nível DEBUG estiver ativo em algum sink
+            log.opt(lazy=True).debug("Resposta recebida da IA:\n---\n{}\n---", lambda: conteudo_resposta)
+            raise
     
     # =================================================================================
     # CORREÇÃO APLICADA AQUI
     # O prompt foi ajustado para instruir explicitamente o uso de 'acao' e 'confianca'.
     # =================================================================================
     def _construir_prompt_usuario(self, dados_tecnicos: Dict[str, Any], info_completa_ativo: Dict[str, Any]) -> str:
-        dados_tecnicos_str = json.dumps(dados_tecnicos, indent=2, ensure_ascii=False)
+        dados_tecnicos_str = json_rapido.dumps(dados_tecnicos, indent=True).decode()
         analise_mercado = info_completa_ativo.get("analise_mercado", {})
-        analise_mercado_str = json.dumps(analise_mercado, indent=2, ensure_ascii=False)
-        info_base_ativo = {k: v for k, v in info_completa_ativo.items() if k != "analise_mercado"}
-        info_base_str = json.dumps(info_base_ativo, indent=2, ensure_ascii=False)
+        analise_mercado_str = json_rapido.dumps(analise_mercado, indent=True).decode()
+        info_base_itens = tuple((k, v) for k, v in info_completa_ativo.items() if k != "analise_mercado")
+        try:
+            info_base_str = _serializar_info_base(info_base_itens)
+        except TypeError:
+            # valores não hasheáveis (listas/dicts) não entram no cache
+            info_base_str = json_rapido.dumps(dict(info_base_itens), indent=True).decode()
 
         return f"""
 Por favor, analise os seguintes dados para o ativo descrito e forneça uma recomendação de trading.
@@ -1,16 +1,22 @@
 # backend/estrategia/analista.pyi
-from typing import Any, Dict, Optional, overload
+from typing import Any, Dict, List, Optional, Tuple, overload
 
 class AnalistaFinanceiro:
     def __init__(self, *args: Any, **kwargs: Any) -> None: ...
     
     @overload
-    def obter_analise(self, dados_tecnicos: Dict[str, Any], info_ativo: Dict[str, Any]) -> Dict[str, Any]: ...
+    async def obter_analise(self, dados_tecnicos: Dict[str, Any], info_ativo: Dict[str, Any]) -> Dict[str, Any]: ...
     
     @overload
-    def obter_analise(self, info_ativo: Dict[str, Any]) -> Dict[str, Any]: ...
+    async def obter_analise(self, info_ativo: Dict[str, Any]) -> Dict[str, Any]: ...
     
     # assinatura "real" que funciona como fallback para o stub
-    def obter_analise(self, *args: Any, **kwargs: Any) -> Dict[str, Any]: ...
+    async def obter_analise(self, *args: Any, **kwargs: Any) -> Dict[str, Any]: ...
+    
+    async def obter_analises_lote(self, lista_ativos: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[Dict[str, Any]]: ...
+    
+    async def submeter_lote(self, lista_ativos: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> Optional[str]: ...
+    
+    async def verificar_lotes(self) -> int: ...
     
     def resumo_operacional(self, dados_tecnicos: Dict[str, Any]) -> Dict[str, Any]: ...
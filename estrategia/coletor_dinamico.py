@@ -1,5 +1,5 @@
-import json
 from pathlib import Path
+from utils import json_rapido
 from utils.logger import log
 
 class ColetorDeAtivos:
@@ -19,19 +19,53 @@ class ColetorDeAtivos:
         except Exception as e:
             log.error(f"Erro ao determinar o caminho do arquivo de ativos: {e}")
             self.caminho_arquivo = None
+        # (mtime_ns, lista de ativos, {CODIGO: ativo}); relido só quando o arquivo muda
+        self._cache: tuple[int, list[dict], dict[str, dict]] | None = None
 
     def carregar_ativos(self) -> list[dict]:
         """
-        Lê o arquivo JSON e retorna a lista de ativos contida nele.
+        Retorna a lista de ativos do arquivo JSON (em cache enquanto o arquivo não mudar).
+        """
+        return self._obter_cache()[1]
+
+    def get_por_codigo(self, codigo: str) -> dict | None:
+        """
+        Busca um ativo pelo código (sem diferenciar maiúsculas), em O(1).
         """
-        if not self.caminho_arquivo or not self.caminho_arquivo.exists():
+        return self._obter_cache()[2].get(codigo.upper())
+
+    def invalidar_cache(self) -> None:
+        """Força a releitura do arquivo na próxima consulta."""
+        self._cache = None
+
+    def _obter_cache(self) -> tuple[int, list[dict], dict[str, dict]]:
+        if not self.caminho_arquivo:
+            log.critical("Caminho do arquivo de ativos indefinido.")
+            return (0, [], {})
+        try:
+            mtime_ns = self.caminho_arquivo.stat().st_mtime_ns
+        except FileNotFoundError:
             log.critical(f"ARQUIVO DE ATIVOS NÃO ENCONTRADO EM: '{self.caminho_arquivo}'. Verifique se o arquivo está na pasta 'backend/data/'.")
-            return []
-        
+            self._cache = None
+            return (0, [], {})
+
+        cache = self._cache
+        if cache is not None and cache[0] == mtime_ns:
+            return cache
+
+        ativos = self._ler_arquivo()
+        indice = {a["codigo"].upper(): a for a in ativos if isinstance(a, dict) and a.get("codigo")}
+        self._cache = (mtime_ns, ativos, indice)
+        return self._cache
+
+    def _ler_arquivo(self) -> list[dict]:
+        """
+        Lê o arquivo JSON e retorna a lista de ativos contida nele.
+        """
         log.info(f"Carregando lista de ativos do arquivo '{self.caminho_arquivo.name}'...")
         try:
-            with open(self.caminho_arquivo, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(self.caminho_arquivo, 'rb') as f:
+                data = json_rapido.loads(f.read())
             
             if isinstance(data, dict):
                 ativos = data.get("ativos", [])
@@ -48,10 +82,9 @@ class ColetorDeAtivos:
             log.info(f"Carregamento concluído. {len(ativos)} ativos encontrados.")
             return ativos
             
-        except json.JSONDecodeError:
+        except json_rapido.JSONDecodeError:
             log.critical(f"ERRO DE SINTAXE NO JSON: O arquivo '{self.caminho_arquivo}' não pôde ser lido.")
             return []
         except Exception as e:
-            log.critical(f"Um erro inesperado ocorreu ao carregar os ativos: {e}", exc_info=True)
+            log.opt(exception=True).critical(f"Um erro inesperado ocorreu ao carregar os ativos: {e}")
             return []
-
@@ -4,5 +4,7 @@ from typing import Any, Dict, List
 class ColetorDeAtivos:
     def __init__(self, *args: Any, **kwargs: Any) -> None: ...
     def carregar_ativos(self) -> List[Dict[str, Any]]: ...
+    def get_por_codigo(self, codigo: str) -> Dict[str, Any] | None: ...
+    def invalidar_cache(self) -> None: ...
     # outros helpers possíveis
     def buscar_ativo(self, codigo: str) -> Dict[str, Any] | None: ...
@@ -1,16 +1,88 @@
 # /estrategia/logica_sinal.py
 
+import numpy as np
 import pandas as pd
-import json
+from functools import wraps
 from pathlib import Path
 from datetime import datetime, timezone
 
+try:
+    from numba import njit  # opcional: compila os laços dos indicadores
+except ImportError:
+    njit = None
+
 from config import settings
+from utils import json_rapido
 from utils.logger import log
 
 # --- Caminho para a pasta de dados ---
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 
+COLUNAS_OHLCV = ['open', 'high', 'low', 'close', 'volume']
+
+def _jit(func):
+    """
+    Compila com numba quando disponível. Sem numba, roda o mesmo laço em Python
+    sobre listas (indexar listas é bem mais barato que indexar arrays numpy).
+    """
+    if njit is not None:
+        return njit(cache=True, fastmath=True)(func)
+
+    @wraps(func)
+    def em_python(*args):
+        return func(*(a.tolist() if isinstance(a, np.ndarray) else a for a in args))
+    return em_python
+
+# Os laços abaixo assumem arrays sem NaN e com pelo menos `periodo` (+1 no RSI) valores;
+# _calcular_indicadores garante as duas coisas antes de chamá-los.
+
+@_jit
+def _ema_atualizar(ema, valores, span):
+    """
+    Aplica os passos da EMA (adjust=False) aos `valores`, a partir de `ema`.
+    Com ema=valores[0] e os demais valores, equivale a ewm(span=span, adjust=False).mean().iloc[-1].
+    """
+    alpha = 2.0 / (span + 1.0)
+    for i in range(len(valores)):
+        ema = alpha * valores[i] + (1.0 - alpha) * ema
+    return ema
+
+@_jit
+def _rsi_ultimo(close, periodo):
+    """RSI do último candle, com médias simples de ganhos e perdas nas últimas `periodo` variações."""
+    n = len(close)
+    ganho = 0.0
+    perda = 0.0
+    for i in range(n - periodo, n):
+        delta = close[i] - close[i - 1]
+        if delta > 0:
+            ganho += delta
+        elif delta < 0:
+            perda -= delta
+    ganho /= periodo
+    perda /= periodo
+    rs = ganho / (perda if perda != 0 else 1e-10)
+    return 100.0 - (100.0 / (1.0 + rs))
+
+@_jit
+def _vwap_ultimo(high, low, close, volume, periodo):
+    """VWAP dos últimos `periodo` candles (preço típico ponderado pelo volume)."""
+    n = len(close)
+    soma_tp_volume = 0.0
+    soma_volume = 0.0
+    for i in range(n - periodo, n):
+        soma_tp_volume += (high[i] + low[i] + close[i]) / 3.0 * volume[i]
+        soma_volume += volume[i]
+    return soma_tp_volume / (soma_volume if soma_volume != 0 else 1e-10)
+
+if njit is not None:
+    # aquecimento: compila (ou carrega do cache) já na importação, e não na primeira requisição
+    _amostra = np.linspace(1.0, 2.0, 256)
+    _ema_atualizar(1.0, _amostra, 9)
+    _rsi_ultimo(_amostra, 14)
+    _vwap_ultimo(_amostra, _amostra, _amostra, _amostra, 14)
+    del _amostra
+
 def salvar_indicadores_tecnicos(par: str, indicadores: dict):
     """
     Salva os indicadores técnicos calculados para um ativo em um arquivo JSON.
@@ -29,14 +101,10 @@ def salvar_indicadores_tecnicos(par: str, indicadores: dict):
     }
 
     try:
-        # Substitui valores NaN por None para compatibilidade com JSON
-        for key, value in indicadores.items():
-            if pd.isna(value):
-                indicadores[key] = None
-
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=4, ensure_ascii=False)
-        log.info(f"Indicadores técnicos para {par} salvos com sucesso em '{file_path}'.")
+        # uma única escrita; NaN já chega como None (calcular_tail) e o orjson grava null de todo modo
+        with open(file_path, 'wb') as f:
+            f.write(json_rapido.dumps(output_data, indent=True))
+        log.debug(f"Indicadores técnicos para {par} salvos com sucesso em '{file_path}'.")
     except IOError as e:
         log.error(f"Não foi possível salvar os indicadores no arquivo '{file_path}': {e}")
 
@@ -56,63 +124,92 @@ class Estrategia:
             "ema_period_50": settings.PERIODO_EMA_50,
             "ema_period_200": settings.PERIODO_EMA_200,
         }
+        self._maior_periodo = max(self.params.values())
         log.info("Módulo de cálculo de indicadores técnicos inicializado.")
 
-    def _calcular_indicadores(self, df: pd.DataFrame) -> pd.DataFrame:
-        if df.empty: return df
+    def _calcular_indicadores(self, df: pd.DataFrame) -> dict:
+        """
+        Extrai os arrays OHLCV (float64, sem NaN) do DataFrame e delega para calcular_tail.
+        """
+        if df.empty: return {}
         try:
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-            df.dropna(subset=['open', 'high', 'low', 'close', 'volume'], inplace=True)
-            if df.empty: return df
-
-            df['ema_9'] = df['close'].ewm(span=self.params["ema_period_9"], adjust=False).mean()
-            df['ema_21'] = df['close'].ewm(span=self.params["ema_period_21"], adjust=False).mean()
-            df['ema_50'] = df['close'].ewm(span=self.params["ema_period_50"], adjust=False).mean()
-            df['ema_200'] = df['close'].ewm(span=self.params["ema_period_200"], adjust=False).mean()
-
-            delta: pd.Series = df['close'].diff().astype(float)
-            gain = delta.where(delta > 0, 0).rolling(window=self.params["rsi_period"]).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=self.params["rsi_period"]).mean()
-            rs = gain / loss.replace(0, 1e-10)
-            df['rsi'] = 100 - (100 / (1 + rs))
-
-            typical_price = (df['high'] + df['low'] + df['close']) / 3
-            tp_volume = typical_price * df['volume']
-            cumulative_tp_volume = tp_volume.rolling(window=self.params["vwap_period"]).sum()
-            cumulative_volume = df['volume'].rolling(window=self.params["vwap_period"]).sum()
-            df['vwap'] = cumulative_tp_volume / cumulative_volume.replace(0, 1e-10)
-            df['volume_sma'] = df['volume'].rolling(window=self.params["volume_period"]).mean()
-            df['vwap_std'] = df['close'].rolling(window=self.params["vwap_period"]).std()
-            df['vwap_upper'] = df['vwap'] + (df['vwap_std'] * self.params["vwap_std_mult"])
-            df['vwap_lower'] = df['vwap'] - (df['vwap_std'] * self.params["vwap_std_mult"])
+            # df[col] custa mais que todos os cálculos juntos; com as colunas do
+            # ClienteBinance (exatamente OHLCV) o bloco inteiro sai num único to_numpy
+            try:
+                if list(df.columns) == COLUNAS_OHLCV:
+                    ohlcv = df.to_numpy(dtype=np.float64).T
+                else:
+                    ohlcv = np.stack([df[col].to_numpy(dtype=np.float64) for col in COLUNAS_OHLCV])
+            except (ValueError, TypeError):
+                ohlcv = np.stack([pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64) for col in COLUNAS_OHLCV])
+            validas = ~np.isnan(ohlcv).any(axis=0)
+            if not validas.all():
+                ohlcv = ohlcv[:, validas]
+            if ohlcv.shape[1] == 0: return {}
+            open_, high, low, close, volume = ohlcv
+            return self.calcular_tail(close, high, low, volume, open_=open_)
 
         except Exception as e:
-            log.error(f"Erro ao calcular indicadores: {e}", exc_info=True)
-        return df
+            log.opt(exception=True).error(f"Erro ao calcular indicadores: {e}")
+            return {}
+
+    def calcular_tail(self, close: np.ndarray, high: np.ndarray, low: np.ndarray, volume: np.ndarray,
+                      open_: np.ndarray | None = None) -> dict:
+        """
+        Indicadores só do último candle (o único consumido), arredondados. RSI, VWAP
+        e médias usam apenas as últimas janelas; as EMAs percorrem a série inteira.
+        """
+        rsi_period = self.params["rsi_period"]
+        vwap_period = self.params["vwap_period"]
+        volume_period = self.params["volume_period"]
+
+        rsi = _rsi_ultimo(close, rsi_period) if len(close) > rsi_period else np.nan
+
+        vwap = vwap_std = np.nan
+        if len(close) >= vwap_period:
+            vwap = _vwap_ultimo(high, low, close, volume, vwap_period)
+            vwap_std = close[-vwap_period:].std(ddof=1)
+        volume_sma = volume[-volume_period:].mean() if len(volume) >= volume_period else np.nan
+
+        valores = {
+            "open": open_[-1] if open_ is not None else np.nan,
+            "high": high[-1], "low": low[-1], "close": close[-1], "volume": volume[-1],
+            **self._emas_ultimas(close),
+            "rsi": rsi,
+            "vwap": vwap,
+            "volume_sma": volume_sma,
+            "vwap_std": vwap_std,
+            "vwap_upper": vwap + vwap_std * self.params["vwap_std_mult"],
+            "vwap_lower": vwap - vwap_std * self.params["vwap_std_mult"],
+        }
+        arredondados = np.round(np.array(list(valores.values()), dtype=np.float64), 6)
+        # janelas incompletas (NaN) viram None de uma vez, em vez de um pd.isna por chave ao salvar
+        return dict(zip(valores, np.where(np.isnan(arredondados), None, arredondados).tolist()))
+
+    def _emas_ultimas(self, close: np.ndarray) -> dict:
+        """
+        EMAs do último candle, sempre sobre a série inteira de fechamentos
+        (mesmo resultado para a mesma entrada, sem estado entre chamadas).
+        """
+        spans = {f"ema_{n}": self.params[f"ema_period_{n}"] for n in (9, 21, 50, 200)}
+        return {chave: _ema_atualizar(close[0], close[1:], span) for chave, span in spans.items()}
 
     def processar_e_salvar_indicadores(self, df_klines: pd.DataFrame, par_ativo: str) -> dict | None:
         """
         Método principal que calcula os indicadores e salva o resultado mais recente.
         """
-        maior_periodo = max(list(self.params.values()))
+        maior_periodo = self._maior_periodo
         if len(df_klines) < maior_periodo:
             log.warning(f"Dados insuficientes para {par_ativo}. Necessário: {maior_periodo}, disponível: {len(df_klines)}.")
             return None
 
-        df_indicadores = self._calcular_indicadores(df_klines.copy())
-        
-        # Pega a última linha com os indicadores mais recentes
-        if df_indicadores.empty:
-            log.warning(f"DataFrame de indicadores vazio para {par_ativo} após os cálculos.")
+        # Indicadores do candle mais recente, já arredondados; o DataFrame não é copiado
+        # nem recebe colunas: os cálculos usam só os arrays numpy extraídos dele
+        indicadores = self._calcular_indicadores(df_klines)
+        if not indicadores:
+            log.warning(f"Indicadores vazios para {par_ativo} após os cálculos.")
             return None
 
-        ultimo_registro = df_indicadores.iloc[-1]
-        
-        # Converte a série de dados para um dicionário e arredonda os valores
-        indicadores = ultimo_registro.round(6).to_dict()
-
         # Salva os indicadores no arquivo JSON
         salvar_indicadores_tecnicos(par=par_ativo, indicadores=indicadores)
 
@@ -9,6 +9,7 @@ class Estrategia:
     def __init__(self, *args: Any, **kwargs: Any) -> None: ...
 
     def processar_e_salvar_indicadores(self, df_klines: Any, par_ativo: str) -> Optional[Dict[str, Any]]: ...
+    def calcular_tail(self, close: Any, high: Any, low: Any, volume: Any, open_: Any = None) -> Dict[str, Any]: ...
     # outras funções possíveis usadas pelo projeto
     def sinal_de_compra(self, dados: Dict[str, Any]) -> bool: ...
     def sinal_de_venda(self, dados: Dict[str, Any]) -> bool: ...
@@ -1,12 +1,14 @@
 # backend/main.py
 from pathlib import Path
 import sys
-import json
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from typing import Any
+from cachetools import TTLCache
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 
 # --- VERIFICAÇÃO E LOG DE MÓDULOS NA INICIALIZAÇÃO ---
 print("="*50)
@@ -59,17 +61,83 @@ except ImportError:
     coletor_noticias = None
     print("[FALHA] Módulo 'coletor_noticias' não encontrado.")
 try:
-    from api.analise_mercado import AnalisadorMercadoCMC
+    # a rotina de atualização e o dashboard compartilham a mesma instância (cliente HTTP,
+    # limitador de requisições e cache de cotações)
+    from api.analise_mercado import obter_analisador_cmc
     modulos_status["AnalisadorMercadoCMC"] = True
     print("[OK] Módulo 'AnalisadorMercadoCMC' carregado.")
 except ImportError:
-    AnalisadorMercadoCMC = None
+    obter_analisador_cmc = None
     print("[FALHA] Módulo 'AnalisadorMercadoCMC' não encontrado.")
 print("Verificação de módulos concluída.")
 print("="*50)
 # --- FIM DA VERIFICAÇÃO ---
 
-app = FastAPI(title="Agente Trader Cripto", version="1.6")
+try:
+    from config import settings
+    INTERVALO_LOTES_IA_S = settings.OPENAI_BATCH_INTERVALO_S
+except Exception:
+    INTERVALO_LOTES_IA_S = 300
+
+# Respostas do dashboard por (par, intervalo): o frontend consulta repetidamente e,
+# dentro de um candle de 1m, o resultado (incluindo a chamada à IA) seria o mesmo
+cache_dashboard: TTLCache = TTLCache(maxsize=512, ttl=55)
+
+# Instâncias únicas, criadas na inicialização e guardadas em app.state: {atributo: (módulo, fábrica)}
+MODULOS_COMPARTILHADOS = {
+    "binance_client": ("ClienteBinance", ClienteBinance),
+    "coletor_ativos": ("ColetorDeAtivos", ColetorDeAtivos),
+    "estrategia": ("Estrategia", Estrategia),
+    "analista_ia": ("AnalistaFinanceiro", AnalistaFinanceiro),
+    "analisador_mercado": ("AnalisadorMercadoCMC", obter_analisador_cmc),
+}
+
+def instanciar_modulos(state: Any):
+    for atributo, (nome, fabrica) in MODULOS_COMPARTILHADOS.items():
+        instancia = None
+        if modulos_status[nome] and fabrica:
+            try:
+                instancia = fabrica()
+            except Exception as e:
+                print(f"[ERRO] Falha ao instanciar '{nome}': {e}")
+        setattr(state, atributo, instancia)
+
+def obter_modulos(*atributos: str) -> tuple:
+    instancias = tuple(getattr(app.state, a, None) for a in atributos)
+    if any(i is None for i in instancias):
+        raise HTTPException(status_code=500, detail="Erro ao instanciar módulos.")
+    return instancias
+
+async def verificar_lotes_ia_periodicamente(analista_ia: Any):
+    """Busca periodicamente os resultados dos lotes enviados à Batch API da OpenAI."""
+    while True:
+        try:
+            salvas = await analista_ia.verificar_lotes()
+            if salvas:
+                print(f"[INFO] {salvas} análise(s) da Batch API salvas.")
+        except Exception as e:
+            print(f"[ERRO] Falha ao verificar os lotes da IA: {e}")
+        await asyncio.sleep(INTERVALO_LOTES_IA_S)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    instanciar_modulos(app.state)
+    tarefa_lotes = None
+    if app.state.analista_ia is not None:
+        tarefa_lotes = asyncio.create_task(verificar_lotes_ia_periodicamente(app.state.analista_ia))
+    yield
+    if tarefa_lotes:
+        tarefa_lotes.cancel()
+        with suppress(asyncio.CancelledError):
+            await tarefa_lotes
+    if coletor_noticias is not None:
+        await coletor_noticias.fechar_cliente()
+    if app.state.analisador_mercado is not None:
+        # cache de cotações do CMC persistido uma vez, no encerramento
+        await asyncio.to_thread(app.state.analisador_mercado.save_cache)
+
+# respostas serializadas com orjson por padrão
+app = FastAPI(title="Agente Trader Cripto", version="1.6", lifespan=lifespan, default_response_class=ORJSONResponse)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
 FRONTEND_DIR = BASE_DIR.parent / "frontend"
@@ -84,85 +152,141 @@ if modulos_status["chat_router"] and chat_router:
 @app.get("/", response_class=FileResponse, include_in_schema=False)
 async def root_index():
     index_path = FRONTEND_DIR / "index.html"
-    if not index_path.exists():
+    try:
+        # um único stat, reaproveitado pelo FileResponse (que senão faria outro)
+        stat_index = index_path.stat()
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Arquivo index.html não encontrado.")
-    return FileResponse(index_path)
+    return FileResponse(index_path, stat_result=stat_index)
 
 @app.get("/api/noticias")
 async def obter_noticias():
     assert coletor_noticias is not None, "Módulo de notícias não carregado."
     caminho_noticias = BASE_DIR / "data" / "noticias.json"
-    if not caminho_noticias.exists():
+    try:
+        stat_noticias = caminho_noticias.stat()
+    except FileNotFoundError:
         try:
             print("[INFO] Arquivo noticias.json não encontrado. Tentando coletar agora...")
-            coletor_noticias.coletar_e_salvar_noticias()
+            await coletor_noticias.coletar_e_salvar_noticias_async()
         except Exception as e:
             print(f"[ERRO] Falha ao coletar notícias sob demanda: {e}")
             raise HTTPException(status_code=500, detail="Falha ao gerar arquivo de notícias.")
-    
-    if not caminho_noticias.exists():
-         raise HTTPException(status_code=404, detail="Arquivo noticias.json não encontrado.")
-    try:
-        with open(caminho_noticias, "r", encoding="utf-8") as f:
-            return JSONResponse(content=json.load(f))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao ler noticias.json: {e}")
+        try:
+            stat_noticias = caminho_noticias.stat()
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Arquivo noticias.json não encontrado.")
+    # o arquivo já é JSON: enviado direto do disco, sem decodificar e serializar de novo;
+    # o stat acima é repassado para o FileResponse não consultar o disco outra vez
+    return FileResponse(caminho_noticias, media_type="application/json", stat_result=stat_noticias)
 
 @app.get("/api/dados/ativos")
 async def listar_ativos():
     assert ColetorDeAtivos is not None, "Módulo ColetorDeAtivos não carregado."
+    coletor_ativos, = obter_modulos("coletor_ativos")
     try:
-        coletor = ColetorDeAtivos()
-        return JSONResponse(content=coletor.carregar_ativos())
+        return ORJSONResponse(content=coletor_ativos.carregar_ativos())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao carregar lista de ativos: {e}")
 
+@app.post("/api/dados/ativos/recarregar")
+async def recarregar_ativos():
+    """Descarta a lista de ativos em cache e lê o arquivo de novo."""
+    coletor_ativos, = obter_modulos("coletor_ativos")
+    coletor_ativos.invalidar_cache()
+    return ORJSONResponse(content={"status": "ok", "ativos": len(coletor_ativos.carregar_ativos())})
+
 @app.get("/api/dashboard/{par_ativo}")
-def obter_dados_dashboard(par_ativo: str, intervalo: str = "1m"):
+async def obter_dados_dashboard(par_ativo: str, intervalo: str = "1m"):
     modulos_necessarios = ["ClienteBinance", "ColetorDeAtivos", "Estrategia", "AnalistaFinanceiro", "AnalisadorMercadoCMC"]
     if not all(modulos_status[m] for m in modulos_necessarios):
         raise HTTPException(status_code=501, detail="Um ou mais módulos de análise não foram inicializados.")
     
-    assert ClienteBinance and ColetorDeAtivos and Estrategia and AnalistaFinanceiro and AnalisadorMercadoCMC
+    binance_client, coletor_ativos, estrategia, analista_ia, analisador_mercado = \
+        obter_modulos("binance_client", "coletor_ativos", "estrategia", "analista_ia", "analisador_mercado")
 
-    try:
-        binance_client, coletor_ativos, estrategia, analista_ia, analisador_mercado = \
-        ClienteBinance(), ColetorDeAtivos(), Estrategia(), AnalistaFinanceiro(), AnalisadorMercadoCMC()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao instanciar módulos: {e}")
+    chave_cache = (par_ativo.upper(), intervalo)
+    resposta_cache = cache_dashboard.get(chave_cache)
+    if resposta_cache is not None:
+        return ORJSONResponse(content=resposta_cache)
 
     simbolo_para_api = f"{par_ativo.upper()}USDT"
-    info_ativo_base = next((a for a in coletor_ativos.carregar_ativos() if a.get("codigo", "").upper() == par_ativo.upper()), None)
+    info_ativo_base = coletor_ativos.get_por_codigo(par_ativo)
     if not info_ativo_base:
         raise HTTPException(status_code=404, detail=f"Ativo {par_ativo} não encontrado")
 
+    async def calcular_dados_tecnicos() -> dict:
+        maior_periodo = max(v for k, v in estrategia.params.items() if 'period' in k)
+        # chamadas bloqueantes (rede/disco/pandas) vão para threads para não travar o event loop
+        df_klines = await asyncio.to_thread(binance_client.obter_klines_historicos, par=simbolo_para_api, intervalo=intervalo, limite=maior_periodo + 50)
+        return await asyncio.to_thread(estrategia.processar_e_salvar_indicadores, df_klines, simbolo_para_api) or {}
+
+    # sentimento (CMC) e klines + indicadores (Binance) são independentes: rodam em paralelo,
+    # só a análise da IA depende dos dois
+    dados_sentimento, dados_tecnicos = await asyncio.gather(
+        asyncio.to_thread(analisador_mercado.get_asset_data, par_ativo.upper()),
+        calcular_dados_tecnicos(),
+        return_exceptions=True,
+    )
+
     # --- CORREÇÃO DE RESILIÊNCIA ---
     # Garante que a chave 'analise_mercado' sempre exista.
-    try:
-        dados_sentimento = analisador_mercado.get_asset_data(symbol=par_ativo.upper())
-        info_ativo_completa = {**info_ativo_base, "analise_mercado": dados_sentimento}
-    except Exception as e:
-        print(f"[AVISO] Falha ao buscar dados de sentimento em tempo real: {e}")
-        info_ativo_completa = {**info_ativo_base, "analise_mercado": {"error": f"Falha ao buscar dados: {e}"}}
+    if isinstance(dados_sentimento, Exception):
+        print(f"[AVISO] Falha ao buscar dados de sentimento em tempo real: {dados_sentimento}")
+        dados_sentimento = {"error": f"Falha ao buscar dados: {dados_sentimento}"}
+    info_ativo_completa = {**info_ativo_base, "analise_mercado": dados_sentimento}
 
-    try:
-        maior_periodo = max(v for k, v in estrategia.params.items() if 'period' in k)
-        df_klines = binance_client.obter_klines_historicos(par=simbolo_para_api, intervalo=intervalo, limite=maior_periodo + 50)
-        dados_tecnicos = estrategia.processar_e_salvar_indicadores(df_klines, simbolo_para_api)
-        dados_tecnicos = dados_tecnicos or {}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro nos indicadores: {e}")
+    if isinstance(dados_tecnicos, Exception):
+        raise HTTPException(status_code=500, detail=f"Erro nos indicadores: {dados_tecnicos}")
 
     try:
-        analise_ia_result = analista_ia.obter_analise(dados_tecnicos, info_ativo_completa)
+        analise_ia_result = await analista_ia.obter_analise(dados_tecnicos, info_ativo_completa)
     except Exception as e:
         analise_ia_result = {"error": "Falha na análise da IA", "detail": str(e)}
 
-    return JSONResponse(content={
+    resposta = {
         "info_ativo": info_ativo_completa,
         "analise_ia": analise_ia_result,
         "indicadores_tecnicos": dados_tecnicos,
-    })
+    }
+    # falhas (IA indisponível, erro de parsing) não entram no cache: a próxima consulta tenta de novo
+    if not ({"erro", "error"} & analise_ia_result.keys()):
+        cache_dashboard[chave_cache] = resposta
+    return ORJSONResponse(content=resposta)
+
+@app.post("/api/ia/lote")
+async def submeter_lote_ia(intervalo: str = "1m"):
+    """
+    Varredura agendada de todos os ativos pela Batch API (resultado assíncrono,
+    gravado pelo verificador de lotes). O dashboard continua usando a chamada em tempo real.
+    """
+    modulos_necessarios = ["ClienteBinance", "ColetorDeAtivos", "Estrategia", "AnalistaFinanceiro"]
+    if not all(modulos_status[m] for m in modulos_necessarios):
+        raise HTTPException(status_code=501, detail="Um ou mais módulos de análise não foram inicializados.")
+
+    binance_client, coletor_ativos, estrategia, analista_ia = \
+        obter_modulos("binance_client", "coletor_ativos", "estrategia", "analista_ia")
+
+    ativos = [a for a in coletor_ativos.carregar_ativos() if a.get("codigo")]
+    maior_periodo = max(v for k, v in estrategia.params.items() if 'period' in k)
+
+    def calcular_dados_tecnicos(ativo: dict) -> dict:
+        simbolo_para_api = f"{ativo['codigo'].upper()}USDT"
+        df_klines = binance_client.obter_klines_historicos(par=simbolo_para_api, intervalo=intervalo, limite=maior_periodo + 50)
+        return estrategia.processar_e_salvar_indicadores(df_klines, simbolo_para_api) or {}
+
+    resultados = await asyncio.gather(*(asyncio.to_thread(calcular_dados_tecnicos, a) for a in ativos), return_exceptions=True)
+    lista_ativos = []
+    for ativo, dados_tecnicos in zip(ativos, resultados):
+        if isinstance(dados_tecnicos, BaseException):
+            print(f"[AVISO] Indicadores de {ativo['codigo']} ignorados no lote: {dados_tecnicos}")
+            continue
+        lista_ativos.append((dados_tecnicos, ativo))
+
+    lote_id = await analista_ia.submeter_lote(lista_ativos)
+    if not lote_id:
+        raise HTTPException(status_code=502, detail="Falha ao enviar o lote para a OpenAI.")
+    return ORJSONResponse(content={"lote_id": lote_id, "ativos": len(lista_ativos)})
 
 print("\n[INFO] API iniciada. Verifique os logs de carregamento de módulos acima.")
 
@@ -1,17 +1,33 @@
 # /backend/noticias/noticias.py
 
-import requests
+import asyncio
+import importlib.util
+import httpx
 from bs4 import BeautifulSoup
+try:
+    # parser HTML em C (lexbor), bem mais rápido que o BS4
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    HTMLParser = None
 import logging
-import json
+import sys
 from pathlib import Path
 from datetime import datetime, timezone
 
+# raiz do projeto no sys.path, como em main.py: o script também roda direto (python noticias/noticias.py)
+BASE_DIR = Path(__file__).resolve().parent.parent
+if str(BASE_DIR) not in sys.path: sys.path.insert(0, str(BASE_DIR))
+from utils import json_rapido
+
 # --- Configuração do Logger e Caminhos ---
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] (Noticias) %(message)s')
-DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+DATA_DIR = BASE_DIR / "data"
 
 URL_CALENDARIO = "https://www.myfxbook.com/pt/forex-economic-calendar"
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+# HTTP/2 só quando o pacote h2 (httpx[http2]) está instalado
+HTTP2 = importlib.util.find_spec("h2") is not None
+_cliente: httpx.AsyncClient | None = None
 
 def salvar_noticias(eventos: list):
     """
@@ -30,8 +46,8 @@ def salvar_noticias(eventos: list):
     }
 
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=4, ensure_ascii=False)
+        with open(file_path, 'wb') as f:
+            f.write(json_rapido.dumps(output_data, indent=True))
         logging.info(f"Notícias salvas com sucesso em '{file_path}'. Total de {len(eventos)} eventos coletados.")
     except IOError as e:
         logging.error(f"Não foi possível salvar as notícias no arquivo '{file_path}': {e}")
@@ -41,104 +57,145 @@ def traduzir_impacto(titulo_impacto):
     mapeamento = {"Alto": "Alta Volatilidade", "Médio": "Moderada Volatilidade", "Baixo": "Baixa Volatilidade", "Feriado": "Feriado"}
     return mapeamento.get(titulo_impacto, "Indefinido")
 
-def _encontrar_tabela_relevante(soup):
-    for table in soup.find_all('table'):
-        headers = [th.get_text(strip=True).lower() for th in table.find_all('th')]
-        if any(k in " ".join(headers) for k in ('hora', 'moeda', 'evento')):
-            return table
-    return None
+def _tabela_relevante(cabecalhos: list[str]) -> bool:
+    texto = " ".join(c.lower() for c in cabecalhos)
+    return any(k in texto for k in ('hora', 'moeda', 'evento'))
 
-def coletar_e_salvar_noticias():
+def _montar_evento(textos: list[str], pais: str, impacto_title: str) -> dict | None:
     """
-    Coleta as notícias do calendário econômico, incluindo o país,
-    e salva o resultado em um arquivo JSON.
+    Monta o evento a partir dos textos das células da linha, do país (title da
+    bandeira) e do title da célula de impacto. Linhas sem evento são ignoradas.
     """
-    logging.info("Iniciando coleta de notícias do calendário econômico...")
-    headers = {"User-Agent": "Mozilla/5.0"}
-    try:
-        response = requests.get(URL_CALENDARIO, headers=headers, timeout=20)
-        response.raise_for_status()
-    except requests.RequestException as e:
-        logging.error(f"Erro de rede ao buscar notícias: {e}")
-        return
-
-    soup = BeautifulSoup(response.text, 'lxml')
-    tabela = soup.find('table', id='economicCalendar') or _encontrar_tabela_relevante(soup)
+    n = len(textos)
+    evento = textos[4] if n > 4 else ""
+    if not evento:
+        return None
+    return {
+        "hora": textos[1] if n > 1 else "",
+        "pais": pais,
+        "moeda": textos[2] if n > 2 else "",
+        "impacto": traduzir_impacto(impacto_title.replace('Impacto ', '')),
+        "evento": evento,
+        "anterior": textos[5] if n > 5 else "N/A",
+        "previsao": textos[6] if n > 6 else "N/A",
+        "atual": textos[7] if n > 7 else "N/A",
+    }
 
+def _extrair_eventos_selectolax(html: str) -> list | None:
+    """Parser principal: selectolax (lexbor, em C) vai direto às linhas por seletor CSS."""
+    tree = HTMLParser(html)
+    tabela = tree.css_first('table#economicCalendar')
+    if tabela is None:
+        tabela = next((t for t in tree.css('table') if _tabela_relevante([th.text(strip=True) for th in t.css('th')])), None)
+    if tabela is None:
+        return None
+
+    eventos = []
+    for linha in tabela.css('tr[class*="economicCalendarRow"]'):
+        cols = linha.css('td')
+        pais = ""
+        if len(cols) > 2:
+            img = cols[2].css_first('img')
+            if img is not None:
+                pais = (img.attributes.get('title') or '').strip()
+        impacto_title = (cols[3].attributes.get('title') or '') if len(cols) > 3 else ''
+        evento = _montar_evento([td.text(strip=True) for td in cols], pais, impacto_title)
+        if evento:
+            eventos.append(evento)
+    return eventos
+
+def _extrair_eventos_bs4(html: str) -> list | None:
+    """Alternativa com BeautifulSoup, usada quando o selectolax não está instalado."""
+    soup = BeautifulSoup(html, 'lxml')
+    tabela = soup.find('table', id='economicCalendar')
     if not tabela:
-        logging.warning("Nenhuma tabela de eventos econômicos encontrada na página.")
-        return
+        tabela = next((t for t in soup.find_all('table') if _tabela_relevante([th.get_text(strip=True) for th in t.find_all('th')])), None)
+    if not tabela:
+        return None
 
-    eventos_coletados = []
+    eventos = []
     tbody = tabela.find('tbody') or tabela
-    
-    def encontrar_linhas_de_evento(tag):
-        return tag.name == 'tr' and tag.has_attr('class') and any('economicCalendarRow' in c for c in tag['class'])
-
-    linhas = tbody.find_all(encontrar_linhas_de_evento)
-
-    for linha in linhas:
-        try:
-            cols = linha.find_all('td')
-            
-            hora = cols[1].get_text(strip=True) if len(cols) > 1 else ""
-            
-            # --- ATUALIZAÇÃO: Coleta de País e Moeda ---
-            moeda_td = cols[2] if len(cols) > 2 else None
-            moeda = ""
-            pais = ""
-            if moeda_td:
-                moeda = moeda_td.get_text(strip=True)
-                img_tag = moeda_td.find('img')
-                if img_tag and img_tag.has_attr('title'):
-                    # --- CORREÇÃO APLICADA AQUI ---
-                    # Garante que o valor de 'title' seja sempre uma string antes de usar .strip()
-                    title_attr = img_tag.get('title', '')
-                    if isinstance(title_attr, list):
-                        pais_raw = title_attr[0] if title_attr else ''
-                    else:
-                        pais_raw = title_attr or ''
-                    pais = pais_raw.strip()
-            
-            evento = cols[4].get_text(strip=True) if len(cols) > 4 else ""
-            anterior = cols[5].get_text(strip=True) if len(cols) > 5 else "N/A"
-            previsao = cols[6].get_text(strip=True) if len(cols) > 6 else "N/A"
-            atual = cols[7].get_text(strip=True) if len(cols) > 7 else "N/A"
-
-            impacto_td = cols[3] if len(cols) > 3 else None
-            impacto_str = "Indefinido"
-            if impacto_td:
-                impacto_title_raw = impacto_td.get('title', '')
-                impacto_title_str = ""
-                if isinstance(impacto_title_raw, list):
-                    impacto_title_str = impacto_title_raw[0] if impacto_title_raw else ''
-                else:
-                    impacto_title_str = impacto_title_raw or "" 
-
-                impacto_title = impacto_title_str.replace('Impacto ', '')
-                impacto_str = traduzir_impacto(impacto_title)
-
-            if evento:
-                 eventos_coletados.append({
-                    "hora": hora,
-                    "pais": pais,
-                    "moeda": moeda, 
-                    "impacto": impacto_str, 
-                    "evento": evento,
-                    "anterior": anterior,
-                    "previsao": previsao,
-                    "atual": atual
-                })
-        except IndexError:
-            logging.warning("Linha da tabela com formato inesperado. Pulando.")
-            continue
+
+    # seletor CSS (soupsieve) em vez de um predicado Python chamado para cada tag da árvore
+    for linha in tbody.select('tr[class*="economicCalendarRow"]'):
+        cols = linha.find_all('td')
+        pais = ""
+        if len(cols) > 2:
+            img_tag = cols[2].find('img')
+            if img_tag and img_tag.has_attr('title'):
+                # Garante que o valor de 'title' seja sempre uma string antes de usar .strip()
+                title_attr = img_tag.get('title', '')
+                if isinstance(title_attr, list):
+                    title_attr = title_attr[0] if title_attr else ''
+                pais = (title_attr or '').strip()
+        impacto_title = ''
+        if len(cols) > 3:
+            impacto_title = cols[3].get('title', '')
+            if isinstance(impacto_title, list):
+                impacto_title = impacto_title[0] if impacto_title else ''
+            impacto_title = impacto_title or ''
+        evento = _montar_evento([td.get_text(strip=True) for td in cols], pais, impacto_title)
+        if evento:
+            eventos.append(evento)
+    return eventos
+
+def _processar_html(html: str):
+    """Extrai os eventos da página e salva o resultado."""
+    extrair = _extrair_eventos_selectolax if HTMLParser is not None else _extrair_eventos_bs4
+    eventos_coletados = extrair(html)
+
+    if eventos_coletados is None:
+        logging.warning("Nenhuma tabela de eventos econômicos encontrada na página.")
+        return
 
     if not eventos_coletados:
         logging.info("Nenhum evento econômico encontrado para coleta.")
     
     salvar_noticias(eventos_coletados)
 
+def _novo_cliente() -> httpx.AsyncClient:
+    return httpx.AsyncClient(http2=HTTP2, timeout=20, headers=HEADERS, follow_redirects=True)
+
+def _obter_cliente() -> httpx.AsyncClient:
+    """Cliente compartilhado (keep-alive entre coletas) do processo do servidor."""
+    global _cliente
+    if _cliente is None or _cliente.is_closed:
+        _cliente = _novo_cliente()
+    return _cliente
+
+async def fechar_cliente():
+    """Fecha o cliente compartilhado (chamar no desligamento do servidor)."""
+    global _cliente
+    if _cliente is not None:
+        await _cliente.aclose()
+        _cliente = None
+
+async def coletar_e_salvar_noticias_async(cliente: httpx.AsyncClient | None = None):
+    """
+    Coleta as notícias do calendário econômico, incluindo o país,
+    e salva o resultado em um arquivo JSON. Não bloqueia o event loop:
+    a requisição é assíncrona e o parsing/gravação rodam numa thread.
+    """
+    logging.info("Iniciando coleta de notícias do calendário econômico...")
+    try:
+        response = await (cliente or _obter_cliente()).get(URL_CALENDARIO)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logging.error(f"Erro de rede ao buscar notícias: {e}")
+        return
+
+    await asyncio.to_thread(_processar_html, response.text)
+
+def coletar_e_salvar_noticias():
+    """
+    Versão síncrona, para execução manual do script (fora de um event loop).
+    Usa um cliente próprio, já que o compartilhado fica preso ao loop em que foi usado.
+    """
+    async def coletar():
+        async with _novo_cliente() as cliente:
+            await coletar_e_salvar_noticias_async(cliente)
+    asyncio.run(coletar())
+
 # Para permitir a execução manual do script
 if __name__ == "__main__":
     coletar_e_salvar_noticias()
-
@@ -1,5 +1,9 @@
 # backend/noticias/noticias.pyi
 from typing import Any, Dict, List
 
+import httpx
+
 def coletar_e_salvar_noticias(*args: Any, **kwargs: Any) -> None: ...
+async def coletar_e_salvar_noticias_async(cliente: httpx.AsyncClient | None = ...) -> None: ...
+async def fechar_cliente() -> None: ...
 def obter_noticias() -> List[Dict[str, Any]]: ...
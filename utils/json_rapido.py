@@ -0,0 +1,33 @@
+# /backend/utils/json_rapido.py
+
+"""
+Leitura/escrita de JSON em bytes com orjson (parser SIMD e serializador em C).
+Se o orjson não estiver instalado, cai para o módulo json da biblioteca padrão
+com o mesmo comportamento (UTF-8 sem escapes, indentação de 2 espaços).
+"""
+
+import json
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.JSONDecodeError é subclasse de json.JSONDecodeError: serve para os dois casos
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data: bytes | str) -> Any:
+    """Decodifica JSON a partir de bytes (ou str)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any, indent: bool = False, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """Serializa para bytes UTF-8; com indent=True usa indentação de 2 espaços."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option, default=default)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False, default=default).encode("utf-8")
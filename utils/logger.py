@@ -1,29 +1,45 @@
 # /backend/utils/logger.py
 
+import os
 import sys
+from dotenv import load_dotenv
 from loguru import logger
 
+# Lido direto do ambiente (e do .env), sem importar config.settings: o logger não depende
+# das chaves de API validadas lá. Em produção use WARNING: o console deixa de receber as
+# mensagens INFO de cada requisição
+load_dotenv()
+LOG_NIVEL_CONSOLE = os.getenv("LOG_NIVEL_CONSOLE", "INFO").upper()
+
 # Remove o handler padrão para poder configurar do zero
 logger.remove()
 
 # Configuração do formato do log
+# backtrace/diagnose desligados nos dois handlers: sem inspeção da pilha e das variáveis locais
+# a cada exceção registrada (custo alto e risco de vazar dados sensíveis nos logs)
 # Adiciona um handler para exibir logs no console com cores e formato claro
 logger.add(
     sys.stderr,
-    level="INFO",
+    level=LOG_NIVEL_CONSOLE,
     format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    colorize=True
+    colorize=True,
+    backtrace=False,
+    diagnose=False
 )
 
 # Adiciona um handler para salvar logs em um arquivo
 # 'rotation' cria um novo arquivo quando o atual atinge 10 MB
 # 'retention' mantém os últimos 5 arquivos de log
+# 'enqueue' entrega as mensagens a uma thread em segundo plano: a escrita em disco sai da requisição (e do event loop)
 logger.add(
     "logs/app_log_{time}.log",
     level="DEBUG",
     rotation="10 MB",
     retention="5 days",
     format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+    enqueue=True,
+    backtrace=False,
+    diagnose=False,
     encoding="utf-8"
 )
 